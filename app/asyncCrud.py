@@ -0,0 +1,232 @@
+from sqlalchemy import insert as sqlInsert, tuple_
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import app.models as models
+import app.crud as crud
+from app.logger import get_logger
+
+logger = get_logger("async_crud")
+
+'''
+Async versions of the crud functions the request handlers use, on an AsyncSession.
+Same queries as app/crud.py, except that relationships a response needs are loaded
+up front, lazy loading is not available on an async session.
+'''
+
+async def getUser(session: AsyncSession, id: int):
+
+    statement = select(models.User).where(models.User.id == id)
+    result = await session.exec(statement)
+    return result.first()
+
+async def getUserByEmail(session: AsyncSession, email: str):
+
+    statement = select(models.User).where(models.User.email == email)
+    result = await session.exec(statement)
+    return result.first()
+
+async def updatePasswordHash(session: AsyncSession, user: models.User, hashedPassword: str):
+    user.hashedPassword = hashedPassword
+    session.add(user)
+    await session.commit()
+
+async def getPantryByNameAndUser(session: AsyncSession, userId: int, name: str):
+
+    statement = select(models.Pantry).where(models.Pantry.userId == userId).where(models.Pantry.pantryNickname == name)
+    result = await session.exec(statement)
+    return result.first()
+
+async def createPantryForUser(session: AsyncSession, userId: int, pantryData: models.PantryCreate):
+
+    newPantry = models.Pantry(
+        userId=userId,
+        pantryNickname=pantryData.pantryNickname
+    )
+
+    session.add(newPantry)
+    await session.commit()
+    await session.refresh(newPantry)
+
+    logger.info("Pantry created", extra={"user_id": userId, "pantry_id": newPantry.pantryId})
+
+    return newPantry
+
+async def getPantriesForUser(session: AsyncSession, userId: int):
+
+    statement = select(models.Pantry).where(models.Pantry.userId == userId)
+    result = await session.exec(statement)
+    return result.all()
+
+async def checkAndAddItem(session: AsyncSession, itemName: str, brand: str):
+    cachedItem = crud.itemCatalogCache.get((itemName, brand))
+    if cachedItem:
+        return cachedItem
+
+    upsertResult = await session.exec(crud.itemUpsertStatement(itemName, brand))
+    newItemId = upsertResult.scalar()
+    if newItemId is not None:
+        logger.info("New Item added to Global Catalog", extra={"item_name": itemName, "item_id": newItemId})
+
+    lookupResult = await session.exec(crud.itemLookupStatement(itemName, brand))
+    item = models.ItemRead.model_validate(lookupResult.first())
+    await session.commit()
+
+    crud.itemCatalogCache.set((itemName, brand), item)
+    return item
+
+async def resolveCatalogItems(session: AsyncSession, itemKeys, chunkSize: int = 1000):
+    '''
+    Maps every (itemName, brand) in itemKeys to its ItemRead, creating the missing catalog rows.
+    Cache misses cost one multi-row upsert and one lookup per chunk instead of a round-trip per item.
+    '''
+    itemsByKey = {}
+    missingKeys = []
+    for key in itemKeys:
+        cachedItem = crud.itemCatalogCache.get(key)
+        if cachedItem:
+            itemsByKey[key] = cachedItem
+        else:
+            missingKeys.append(key)
+
+    missingKeys.sort(key=lambda key: (key[0] or "", key[1] or ""))
+    resolved = {}
+    for start in range(0, len(missingKeys), chunkSize):
+        chunk = missingKeys[start:start + chunkSize]
+        await session.exec(crud.itemBulkUpsertStatement(chunk))
+        result = await session.exec(crud.itemBulkLookupStatement(chunk))
+        for item in result.all():
+            resolved[(item.itemName, item.brand)] = models.ItemRead.model_validate(item)
+
+    if missingKeys:
+        await session.commit()
+        logger.info("Resolved catalog items", extra={"cached": len(itemsByKey), "looked_up": len(missingKeys)})
+
+    for key, item in resolved.items():
+        crud.itemCatalogCache.set(key, item)
+    itemsByKey.update(resolved)
+
+    return itemsByKey
+
+async def bulkAddItemsToPantry(session: AsyncSession, pantryId: int, rows, chunkSize: int = 2000):
+    '''
+    rows is [(rowNumber, PantryItemCreate)]. Resolves the catalog for all rows at once,
+    then inserts the pantry items with multi-row INSERTs in one transaction.
+    Returns the number of rows inserted.
+    '''
+    itemsByKey = await resolveCatalogItems(session, {(row.itemName, row.brand) for _, row in rows})
+
+    pantryItemValues = [
+        {
+            "purchaseDate": row.purchaseDate,
+            "pantryId": pantryId,
+            "itemId": itemsByKey[(row.itemName, row.brand)].itemId,
+            "quantity": row.quantity,
+            "unit": row.unit
+        }
+        for _, row in rows
+    ]
+
+    for start in range(0, len(pantryItemValues), chunkSize):
+        await session.exec(sqlInsert(models.PantryItem).values(pantryItemValues[start:start + chunkSize]))
+    await session.commit()
+
+    logger.info("Bulk added items to pantry", extra={"pantry_id": pantryId, "item_count": len(pantryItemValues)})
+    return len(pantryItemValues)
+
+async def getSecurePantry(session: AsyncSession, pantryId: int, userId: int):
+    statement = select(models.Pantry).where(models.Pantry.pantryId == pantryId).where(models.Pantry.userId == userId)
+    result = await session.exec(statement)
+    return result.first()
+
+async def addItemToPantry(session: AsyncSession, pantryItemData: models.PantryItemCreate, pantryId: int):
+
+    item = await checkAndAddItem(session, pantryItemData.itemName, pantryItemData.brand)
+
+    newPantryItem = models.PantryItem(
+        purchaseDate=pantryItemData.purchaseDate, #changeNeeded - curr assuming user provides date
+        pantryId=pantryId,
+        itemId=item.itemId,
+        quantity=pantryItemData.quantity,
+        unit=pantryItemData.unit
+    )
+    session.add(newPantryItem)
+    await session.commit()
+    await session.refresh(newPantryItem)
+
+    # the response includes the catalog item, it is already at hand instead of lazy loaded
+    return models.PantryItemReadWithItem.model_validate({**newPantryItem.model_dump(), "item": item})
+
+async def getItemsForPantry(session: AsyncSession, pantryId: int):
+    statement = (
+        select(models.PantryItem)
+        .where(models.PantryItem.pantryId == pantryId)
+        .options(selectinload(models.PantryItem.item)))
+    result = await session.exec(statement)
+    return result.all()
+
+PANTRY_ITEM_FIELDS = ["id", "pantryId", "itemId", "quantity", "unit", "purchaseDate", "item"]
+CATALOG_ITEM_FIELDS = ["itemId", "itemName", "brand", "avgShelfLife"]
+
+async def getPantryItemsPage(session: AsyncSession, pantryId: int, limit: int, sortBy: str = "id", after=None, fields=None):
+    '''
+    One page of a pantry's items in (sortBy, id) order, starting after the (sortValue, id) key in after.
+    Selects only the requested fields, the catalog row comes from a join in the same query.
+    Returns (items, nextKey), nextKey is the key to continue after, None on the last page.
+    '''
+    fields = fields or PANTRY_ITEM_FIELDS
+    sortColumn = models.PantryItem.purchaseDate if sortBy == "purchaseDate" else models.PantryItem.id
+
+    # the sort key is always selected, the cursor is built from it
+    pantryColumns = [name for name in PANTRY_ITEM_FIELDS if name != "item" and (name in fields or name in ("id", sortColumn.key))]
+    columns = [getattr(models.PantryItem, name).label(name) for name in pantryColumns]
+
+    includeItem = "item" in fields
+    if includeItem:
+        columns += [getattr(models.Item, name).label(f"item.{name}") for name in CATALOG_ITEM_FIELDS]
+
+    statement = select(*columns).where(models.PantryItem.pantryId == pantryId)
+    if includeItem:
+        statement = statement.join(models.Item, models.Item.itemId == models.PantryItem.itemId)
+
+    if after is not None:
+        if sortBy == "purchaseDate":
+            statement = statement.where(tuple_(models.PantryItem.purchaseDate, models.PantryItem.id) > tuple_(after[0], after[1]))
+        else:
+            statement = statement.where(models.PantryItem.id > after[1])
+
+    # one extra row tells whether there is a next page
+    statement = statement.order_by(sortColumn, models.PantryItem.id).limit(limit + 1)
+
+    result = await session.exec(statement)
+    rows = result.all()
+
+    hasMore = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        mapping = row._mapping
+        item = {name: mapping[name] for name in pantryColumns if name in fields}
+        if includeItem:
+            item["item"] = {name: mapping[f"item.{name}"] for name in CATALOG_ITEM_FIELDS}
+        items.append(item)
+
+    nextKey = None
+    if hasMore:
+        lastRow = rows[-1]._mapping
+        nextKey = (lastRow[sortColumn.key], lastRow["id"])
+
+    return items, nextKey
+
+async def getCurrentMealFragments(session: AsyncSession, userId: int):
+    '''
+    Only the window and the stored JSON text, the response is stitched from them without parsing.
+    '''
+    statement = (select(models.ProactiveMealSuggestions.mealWindow, models.ProactiveMealSuggestions.suggestionsJson)
+                .where(models.ProactiveMealSuggestions.userId == userId,
+                    models.ProactiveMealSuggestions.consumed == False)
+                .order_by(models.ProactiveMealSuggestions.id))
+
+    result = await session.exec(statement)
+    return result.all()
@@ -0,0 +1,128 @@
+import csv
+import json
+import os
+from typing import Optional
+from pydantic import ValidationError
+import app.models as models
+
+'''
+Parses a bulk pantry import body into PantryItemCreate rows.
+Accepts a JSON array (application/json), one JSON object per line (application/x-ndjson)
+or CSV with a header row (text/csv). NDJSON and CSV are read line by line as the body streams in.
+A row that doesn't validate is reported with its 1-based row number and skipped,
+it never fails the rest of the import.
+'''
+
+BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "5000"))
+# a JSON array is parsed in one go, this bounds what is buffered for it (and for any single line)
+BULK_IMPORT_MAX_BYTES = int(os.getenv("BULK_IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+
+class BulkImportTooLarge(Exception):
+    pass
+
+async def _limitedChunks(chunks):
+    # running count, Content-Length can be missing (chunked uploads) or wrong
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > BULK_IMPORT_MAX_BYTES:
+            raise BulkImportTooLarge(f"A bulk import body is at most {BULK_IMPORT_MAX_BYTES} bytes")
+        yield chunk
+
+async def _lines(chunks):
+    # raw bytes, each record generator decodes its own lines so one bad line is one failed row
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+async def _jsonArrayRecords(chunks):
+    body = b"".join([chunk async for chunk in chunks])
+    records = json.loads(body or b"[]")
+    if not isinstance(records, list):
+        raise ValueError("JSON body must be an array of items")
+    for record in records:
+        yield record
+
+async def _ndjsonRecords(chunks):
+    async for line in _lines(chunks):
+        if line.strip():
+            try:
+                yield json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                yield e
+
+async def _csvRecords(chunks):
+    # one line per row, quoted values spanning several lines are not supported
+    header = None
+    async for rawLine in _lines(chunks):
+        if not rawLine.strip():
+            continue
+        try:
+            line = rawLine.decode("utf-8")
+        except UnicodeDecodeError as e:
+            if header is None:
+                raise ValueError(f"CSV header row is not valid UTF-8: {e}")
+            yield e
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        # empty cells mean "not given", like a missing key in JSON
+        yield {name: value.strip() or None for name, value in zip(header, values)}
+
+def _describe(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" if detail["loc"] else detail["msg"]
+            for detail in error.errors()
+        )
+    return str(error)
+
+async def parseRows(contentType: str, chunks, contentLength: Optional[str] = None):
+    '''
+    Returns (rows, errors): rows is [(rowNumber, PantryItemCreate)], errors is [BulkImportRowError].
+    Raises ValueError for an unsupported or unreadable body,
+    BulkImportTooLarge past BULK_IMPORT_MAX_ROWS or BULK_IMPORT_MAX_BYTES.
+    '''
+    if contentLength and contentLength.isdigit() and int(contentLength) > BULK_IMPORT_MAX_BYTES:
+        raise BulkImportTooLarge(f"A bulk import body is at most {BULK_IMPORT_MAX_BYTES} bytes")
+    chunks = _limitedChunks(chunks)
+
+    mediaType = contentType.split(";")[0].strip().lower()
+    if mediaType == "application/json":
+        records = _jsonArrayRecords(chunks)
+    elif mediaType in ("application/x-ndjson", "application/ndjson"):
+        records = _ndjsonRecords(chunks)
+    elif mediaType == "text/csv":
+        records = _csvRecords(chunks)
+    else:
+        raise ValueError(f"Unsupported content type '{mediaType}', use application/json, application/x-ndjson or text/csv")
+
+    rows = []
+    errors = []
+    rowNumber = 0
+    async for record in records:
+        rowNumber += 1
+        if rowNumber > BULK_IMPORT_MAX_ROWS:
+            raise BulkImportTooLarge(f"A bulk import takes at most {BULK_IMPORT_MAX_ROWS} rows")
+
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if isinstance(record, dict):
+                # brand and unit are optional in an import, a missing key means unknown
+                record = {"brand": None, "unit": None, **record}
+            row = models.PantryItemCreate.model_validate(record)
+            if not row.itemName:
+                raise ValueError("itemName is required")
+            rows.append((rowNumber, row))
+        except (ValidationError, ValueError) as e:
+            errors.append(models.BulkImportRowError(row=rowNumber, error=_describe(e)))
+
+    return rows, errors
@@ -1,16 +1,19 @@
 from typing import Literal
 from xxlimited import new
 import app.models as models
-import app.security as security
+import app.mealResponseCache as mealResponseCache
+from app.ttlCache import TtlLruCache
 from sqlalchemy.orm import selectinload
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, values, column, Integer, DateTime, String
+from sqlalchemy import update as sqlUpdate, delete as sqlDelete
+from sqlalchemy.dialects.postgresql import insert as pgInsert
 from sqlmodel import Session, select
 from sqlalchemy.sql import literal
 from enum import IntEnum
 from datetime import date, datetime, timedelta
 from typing import Optional, List
+import os
 import random
-import json
 from app.logger import get_logger
 
 logger = get_logger("crud")
@@ -24,33 +27,13 @@ MEAL_WINDOWS = {
 
 WINDOW_TO_INT = {v: k for k, v in MEAL_WINDOWS.items()}
 
-def getUser(session: Session, id: int):
-
-    statement = select(models.User).where(models.User.id == id)
-    user = session.exec(statement).first()
-    return user
-
 def getUserByEmail(session: Session, email: str):
 
     statement = select(models.User).where(models.User.email == email)
     user = session.exec(statement).first()
     return user
 
-def authenticateUser(session: Session, userCredentials: models.UserLogin):
-    user = getUserByEmail(session, userCredentials.email)
-<<<<<<< HEAD
-=======
-    
->>>>>>> 88c7569 (-Added logging -Fixed bugs related to meal triggers and old meal cleanups -Other code cleanup)
-    if user and security.verifyPassword(userCredentials.password, user.hashedPassword):
-        logger.info("User authentication successful", extra={"user_id": user.id})
-        return user
-    
-    logger.warning("User authentication failed", extra={"email": userCredentials.email})
-    return None
-
-def createUser(session: Session, userData: models.UserCreate):
-    hashedPassword = security.getHashedPassword(userData.password)
+def createUser(session: Session, userData: models.UserCreate, hashedPassword: str):
 
     newUser = models.User(
         email=userData.email,
@@ -67,79 +50,40 @@ def createUser(session: Session, userData: models.UserCreate):
 
     return newUser
 
-def getPantryByNameAndUser(session: Session, userId: int, name: str):
-
-    statement = select(models.Pantry).where(models.Pantry.userId == userId).where(models.Pantry.pantryNickname == name)
-    pantryForUser = session.exec(statement).first()
-
-    return pantryForUser
-
-def createPantryForUser(session: Session, userId: int, pantryData: models.PantryCreate):
-
-    newPantry = models.Pantry(
-        userId=userId,
-        pantryNickname=pantryData.pantryNickname
-    )
-
-    session.add(newPantry)
-    session.commit()
-    session.refresh(newPantry)
-
-    logger.info("Pantry created", extra={"user_id": userId, "pantry_id": newPantry.pantryId})
-
-    return newPantry
-
-def getPantriesForUser(session: Session, userId: int):
-
-    statement = select(models.Pantry).where(models.Pantry.userId == userId)
-    pantries = session.exec(statement).all()
-    return pantries
-
-def checkAndAddItem(session: Session, itemName: str, brand: str):
-    statement = select(models.Item).where(models.Item.itemName == itemName).where(models.Item.brand == brand)
-    item = session.exec(statement).first()
-
-    if item:
-        return item
-    
-    newItem = models.Item(
-        brand=brand,
-        itemName=itemName,
-        avgShelfLife=5 #@changeNeeded - get the average shelf life or have user input it
-    )
-
-    session.add(newItem)
-    session.commit()
-    session.refresh(newItem)
-
-    logger.info("New Item added to Global Catalog", extra={"item_name": itemName, "item_id": newItem.itemId})
-
-    return newItem
-
-def getSecurePantry(session: Session, pantryId: int, userId: int):
-    statement = select(models.Pantry).where(models.Pantry.pantryId == pantryId).where(models.Pantry.userId == userId)
-    pantryFound = session.exec(statement).first()
-
-    if pantryFound:
-        return pantryFound
-    return None
-
-def addItemToPantry(session: Session, pantryItemData: models.PantryItemCreate, pantryId: int):
-
-    item = checkAndAddItem(session, pantryItemData.itemName, pantryItemData.brand)
-    
-    newPantryItem = models.PantryItem(
-        purchaseDate=pantryItemData.purchaseDate, #changeNeeded - curr assuming user provides date
-        pantryId=pantryId,
-        itemId=item.itemId,
-        quantity=pantryItemData.quantity,
-        unit=pantryItemData.unit
-    )
-    session.add(newPantryItem)
-    session.commit()
-    session.refresh(newPantryItem)
-
-    return newPantryItem
+ITEM_CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("ITEM_CATALOG_CACHE_MAX_ENTRIES", "10000"))
+ITEM_CATALOG_CACHE_TTL_SECONDS = float(os.getenv("ITEM_CATALOG_CACHE_TTL_SECONDS", "3600"))
+
+# (itemName, brand) -> ItemRead. Only committed rows go in, a cached itemId always exists
+itemCatalogCache = TtlLruCache(ITEM_CATALOG_CACHE_MAX_ENTRIES, ITEM_CATALOG_CACHE_TTL_SECONDS)
+
+def itemLookupStatement(itemName: str, brand: str):
+    # IS NOT DISTINCT FROM so a missing brand matches the existing row with a missing brand
+    return select(models.Item).where(models.Item.itemName == itemName, models.Item.brand.is_not_distinct_from(brand))
+
+def itemUpsertStatement(itemName: str, brand: str):
+    '''
+    Inserts the catalog row unless (itemName, brand) already exists, returning the new itemId.
+    Returns nothing on conflict, a concurrent add of the same item wins and is read back instead.
+    '''
+    return (pgInsert(models.Item)
+            .values(itemName=itemName, brand=brand, avgShelfLife=5) #@changeNeeded - get the average shelf life or have user input it
+            .on_conflict_do_nothing()
+            .returning(models.Item.itemId))
+
+def itemBulkUpsertStatement(itemKeys):
+    '''
+    Multi-row version of itemUpsertStatement for [(itemName, brand), ...].
+    Keys should be sorted, concurrent imports then take the index locks in the same order.
+    '''
+    return (pgInsert(models.Item)
+            .values([{"itemName": itemName, "brand": brand, "avgShelfLife": 5} for itemName, brand in itemKeys])
+            .on_conflict_do_nothing())
+
+def itemBulkLookupStatement(itemKeys):
+    wanted = values(column("itemName", String), column("brand", String), name="wanted").data(list(itemKeys))
+    return (select(models.Item)
+            .join(wanted, and_(models.Item.itemName == wanted.c.itemName,
+                models.Item.brand.is_not_distinct_from(wanted.c.brand))))
 
 def getItemsToUseForMeals(session: Session, userId: int, userSuggestions: Optional[models.MealRequestPriorityItems]):
     """
@@ -244,30 +188,77 @@ def createUserPreferences(session, userId):
 
     return newUserPreferenceEntry 
 
-def getDueUsersByMealTriggers(session, now):
-    statement = select(models.UserMealTrigger).where(models.UserMealTrigger.nextRun <= now)
-    usersForMealCompute = session.exec(statement).all()
-
-    if len(usersForMealCompute) > 0:
-        logger.info("Found users due for meal generation", extra={"count": len(usersForMealCompute), "trigger_time": now.isoformat()})
-
-    return usersForMealCompute
-
-def getUserPreferences(session, userId):
-    statement = select(models.UserPreferences).where(models.UserPreferences.userId == userId)
-    userPreferences = session.exec(statement).first()
-    return userPreferences
-
-def updateNextRunForUser(userMealTriggerDbObject: models.UserMealTrigger, nextRun, nextMealWindowKey):
-
-    userMealTriggerDbObject.nextRun = nextRun
-    userMealTriggerDbObject.nextMealWindowToCompute = nextMealWindowKey
-    return
-
-def updateCurrentWindowEndTime(userMealTriggerObject: models.UserMealTrigger, currentWindowEndTime):
-    userMealTriggerObject.toBeDeletedMealId = userMealTriggerObject.currentActiveMeal
-    userMealTriggerObject.currentMealWindowEndTime = currentWindowEndTime
-    return
+def getAllMealTriggerSchedules(session):
+    statement = (select(models.UserMealTrigger.userId, models.UserMealTrigger.nextRun)
+                .execution_options(yield_per=10000))
+    return session.exec(statement)
+
+def getTriggersWithPreferences(session, now=None, userIds=None, shard=None, shardCount=None):
+    '''
+    One query for a whole batch: triggers joined with the preferences needed to compute their next run.
+    now limits it to due triggers, userIds to the given users, shard/shardCount to userId % shardCount == shard.
+    Trigger rows are locked with SKIP LOCKED, so a second scheduler running at the same time
+    skips the rows this one is moving forward instead of queueing those users again.
+    '''
+    statement = (select(models.UserMealTrigger, models.UserPreferences)
+                .join(models.UserPreferences, models.UserPreferences.userId == models.UserMealTrigger.userId)
+                .with_for_update(of=models.UserMealTrigger, skip_locked=True))
+
+    if now is not None:
+        statement = statement.where(models.UserMealTrigger.nextRun <= now)
+    if userIds is not None:
+        statement = statement.where(models.UserMealTrigger.userId.in_(userIds))
+    if shard is not None:
+        statement = statement.where(models.UserMealTrigger.userId % shardCount == shard)
+
+    triggerRows = session.exec(statement).all()
+
+    if len(triggerRows) > 0:
+        logger.info("Loaded meal triggers with preferences", extra={"count": len(triggerRows), "shard": shard})
+
+    return triggerRows
+
+def getTriggerUserIds(session, userIds):
+    '''
+    Which of userIds have a trigger (with preferences), without locking, so rows another scheduler holds are included.
+    '''
+    statement = (select(models.UserMealTrigger.userId)
+                .join(models.UserPreferences, models.UserPreferences.userId == models.UserMealTrigger.userId)
+                .where(models.UserMealTrigger.userId.in_(userIds)))
+    return set(session.exec(statement).all())
+
+def bulkUpdateMealTriggers(session, triggerUpdates, chunkSize: int = 5000):
+    '''
+    Writes next run / window end for many triggers as
+    UPDATE usermealtrigger SET ... FROM (VALUES ...) AS v WHERE usermealtrigger.id = v.id
+    The meal that is current right now becomes the one to delete when its window ends.
+    '''
+    for start in range(0, len(triggerUpdates), chunkSize):
+        chunk = triggerUpdates[start:start + chunkSize]
+
+        newValues = values(
+            column("id", Integer),
+            column("nextRun", DateTime),
+            column("nextMealWindowToCompute", Integer),
+            column("currentMealWindowEndTime", DateTime),
+            name="newValues"
+        ).data([
+            (update["id"], update["nextRun"], update["nextMealWindowToCompute"], update["currentMealWindowEndTime"])
+            for update in chunk
+        ])
+
+        statement = (sqlUpdate(models.UserMealTrigger)
+                    .where(models.UserMealTrigger.id == newValues.c.id)
+                    .values(
+                        nextRun=newValues.c.nextRun,
+                        nextMealWindowToCompute=newValues.c.nextMealWindowToCompute,
+                        currentMealWindowEndTime=newValues.c.currentMealWindowEndTime,
+                        toBeDeletedMealId=models.UserMealTrigger.currentActiveMeal)
+                    .execution_options(synchronize_session=False))
+
+        session.exec(statement)
+
+    logger.info("Bulk updated meal triggers", extra={"count": len(triggerUpdates)})
 
 def createNextTriggerEntryForUser(session, userMealTriggerEntry):
     session.add(userMealTriggerEntry)
@@ -286,6 +277,7 @@ def storeProactiveMealSuggestions(session, userId, suggestionsJson, mealWindow):
     session.refresh(newSuggestionForUser)
 
     logger.info("Stored proactive meal suggestion", extra={"userId": userId, "window": mealWindow})
+    mealResponseCache.invalidateUsers([userId])
 
     statement = select(models.UserMealTrigger).where(newSuggestionForUser.userId == models.UserMealTrigger.userId)
     userTrigger = session.exec(statement).first()
@@ -297,41 +289,32 @@ def storeProactiveMealSuggestions(session, userId, suggestionsJson, mealWindow):
 
     return newSuggestionForUser
 
-def getCurrentMeals(session: Session, userId: int):
-
-    statement = (select(models.ProactiveMealSuggestions)
-                .where(models.ProactiveMealSuggestions.userId == userId,
-                    models.ProactiveMealSuggestions.consumed == False))
-    
-    currentMeals = session.exec(statement).all()
-
-    newMealSuggestionResponse = models.ProactiveMealResponse()
-
-    for meal in currentMeals:
-        parsed = json.loads(meal.suggestionsJson)
-        setattr(newMealSuggestionResponse, meal.mealWindow, parsed)
-
-    return newMealSuggestionResponse
-
 def cleanOldMeals(session, now):
+    '''
+    Deletes every meal whose window has ended in one DELETE ... USING ... RETURNING,
+    then clears the pointer to it on the triggers in one UPDATE.
+    Returns the ids of the users whose meals were removed, the caller invalidates their
+    cached /proactiveMeals/ responses once it has committed.
+    '''
     logger.info("Looking for meals to delete")
-    statement = (select(models.ProactiveMealSuggestions, models.UserMealTrigger).
-                join(models.UserMealTrigger, models.ProactiveMealSuggestions.id == models.UserMealTrigger.toBeDeletedMealId).
-                where(( models.UserMealTrigger.currentMealWindowEndTime <= now)))
+    deleteStatement = (sqlDelete(models.ProactiveMealSuggestions)
+                .where(models.ProactiveMealSuggestions.id == models.UserMealTrigger.toBeDeletedMealId,
+                    models.UserMealTrigger.currentMealWindowEndTime <= now)
+                .returning(models.ProactiveMealSuggestions.userId)
+                .execution_options(synchronize_session=False))
 
-    results = session.exec(statement).all()
-    
-    affectedUsers = []
-    deletedCount = 0
-    for meal, trigger in results:
-        session.delete(meal)
-        affectedUsers.append(trigger.userId)
-        trigger.toBeDeletedMealId = None
-        session.add(trigger)
-        deletedCount += 1
+    affectedUsers = list(session.exec(deleteStatement).scalars().all())
+
+    resetStatement = (sqlUpdate(models.UserMealTrigger)
+                .where(models.UserMealTrigger.toBeDeletedMealId.is_not(None),
+                    models.UserMealTrigger.currentMealWindowEndTime <= now)
+                .values(toBeDeletedMealId=None)
+                .execution_options(synchronize_session=False))
+
+    session.exec(resetStatement)
         
-    if deletedCount > 0:
-        logger.info("Cleaned up old meals", extra={"deletedCount":deletedCount})
+    if affectedUsers:
+        logger.info("Cleaned up old meals", extra={"deletedCount": len(affectedUsers)})
     
     return affectedUsers
 
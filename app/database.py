@@ -1,7 +1,14 @@
 from curses import echo
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 from sqlmodel import create_engine, Session, SQLModel
+from sqlalchemy import exc, text
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.logger import get_logger
 
 logger = get_logger("database")
@@ -19,7 +26,111 @@ DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql://{DB_USER}:{DB_PASSWORD}@
 safe_url = DATABASE_URL.split("@")[-1] 
 logger.info(f"Connecting to database at {safe_url}")
 
-engine = create_engine(DATABASE_URL, echo=False)
+# read per process, so the API, the workers and beat each size their pool through their own env.
+# Every process opens up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections per engine,
+# which times the number of processes has to stay under postgres max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# behind PgBouncer in transaction mode: PgBouncer does the pooling, and server-side
+# prepared statements can't be relied on since consecutive transactions may land on different servers
+DB_PGBOUNCER_MODE = os.getenv("DB_PGBOUNCER_MODE", "false").lower() == "true"
+
+class InstrumentedPoolMixin:
+    '''
+    Counts how long checkouts wait for a connection and how many give up at pool_timeout.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._statsLock = threading.Lock()
+        self.checkouts = 0
+        self.checkoutTimeouts = 0
+        self.totalWaitMs = 0.0
+        self.maxWaitMs = 0.0
+
+    def _do_get(self):
+        startTime = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._statsLock:
+                self.checkoutTimeouts += 1
+            raise
+
+        waitMs = (time.perf_counter() - startTime) * 1000
+        with self._statsLock:
+            self.checkouts += 1
+            self.totalWaitMs += waitMs
+            self.maxWaitMs = max(self.maxWaitMs, waitMs)
+        return connection
+
+    def getMetrics(self):
+        metrics = {
+            "checkouts": self.checkouts,
+            "checkoutTimeouts": self.checkoutTimeouts,
+            "avgWaitMs": round(self.totalWaitMs / self.checkouts, 2) if self.checkouts else 0.0,
+            "maxWaitMs": round(self.maxWaitMs, 2)
+        }
+        if isinstance(self, QueuePool):
+            metrics.update({
+                "size": self.size(),
+                "checkedOut": self.checkedout(),
+                "checkedIn": self.checkedin(),
+                "overflow": self.overflow()
+            })
+        return metrics
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+class InstrumentedNullPool(InstrumentedPoolMixin, NullPool):
+    pass
+
+def _poolOptions(poolClass):
+    if DB_PGBOUNCER_MODE:
+        return {"poolclass": InstrumentedNullPool}
+    return {
+        "poolclass": poolClass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+engine = create_engine(DATABASE_URL, echo=False, **_poolOptions(InstrumentedQueuePool))
+
+# request handlers talk to postgres through asyncpg, celery workers and the scheduler stay on the sync engine
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", f"postgresql+asyncpg://{DATABASE_URL.split('://', 1)[1]}")
+
+asyncConnectArgs = {}
+if DB_PGBOUNCER_MODE:
+    # no statement cache, and unique names so a prepared statement never collides on a shared server connection
+    asyncConnectArgs = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__"
+    }
+
+asyncEngine = create_async_engine(ASYNC_DATABASE_URL, echo=False, connect_args=asyncConnectArgs, **_poolOptions(InstrumentedAsyncQueuePool))
+
+logger.info("Database pools configured", extra={
+    "pgbouncer_mode": DB_PGBOUNCER_MODE,
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW
+})
+
+def getPoolMetrics():
+    return {
+        "pgbouncerMode": DB_PGBOUNCER_MODE,
+        "sync": engine.pool.getMetrics(),
+        "async": asyncEngine.sync_engine.pool.getMetrics()
+    }
 
 def createDbAndTables():
     '''
@@ -27,14 +138,64 @@ def createDbAndTables():
     '''
     try:
         SQLModel.metadata.create_all(engine)
+        ensureItemUniqueIndex()
         logger.info("Database tables verified/created successfully")
     except Exception as e:
         logger.critical(f"Database schema creation failed: {str(e)}")
         raise e
 
+# any constant, held by whichever process runs the item index migration so concurrent startups wait for it
+ITEM_INDEX_MIGRATION_LOCK_ID = 7412001
+
+def ensureItemUniqueIndex():
+    '''
+    create_all only adds indexes together with a new table, so on a database created before
+    uq_item_name_brand existed it is built here. Duplicate (itemName, brand) rows are merged first:
+    pantry items are repointed to the lowest itemId of their group and the other rows deleted.
+    NULLS NOT DISTINCT needs PostgreSQL 15 or later.
+    '''
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lockId)"), {"lockId": ITEM_INDEX_MIGRATION_LOCK_ID})
+
+        indexExists = connection.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = 'uq_item_name_brand'")).first()
+        if indexExists:
+            return
+
+        serverVersion = int(connection.execute(text("SHOW server_version_num")).scalar())
+        if serverVersion < 150000:
+            raise RuntimeError("uq_item_name_brand uses NULLS NOT DISTINCT, which needs PostgreSQL 15 or later")
+
+        # nothing may insert a new duplicate between the merge and the index build
+        connection.execute(text('LOCK TABLE item IN SHARE ROW EXCLUSIVE MODE'))
+
+        # PARTITION BY groups missing brands together, the same way NULLS NOT DISTINCT treats them
+        duplicates = '''
+            SELECT "itemId", keepId FROM (
+                SELECT "itemId", min("itemId") OVER (PARTITION BY "itemName", brand) AS keepId FROM item
+            ) grouped WHERE "itemId" <> keepId
+        '''
+        repointed = connection.execute(text(f'''
+            UPDATE pantryitem SET "itemId" = duplicate.keepId
+            FROM ({duplicates}) duplicate WHERE pantryitem."itemId" = duplicate."itemId"
+        ''')).rowcount
+        removed = connection.execute(text(f'''
+            DELETE FROM item USING ({duplicates}) duplicate WHERE item."itemId" = duplicate."itemId"
+        ''')).rowcount
+
+        connection.execute(text('CREATE UNIQUE INDEX uq_item_name_brand ON item ("itemName", brand) NULLS NOT DISTINCT'))
+        logger.info("Created unique item index", extra={"duplicates_removed": removed, "pantry_items_repointed": repointed})
+
 def getSession():
     '''
     FastAPI will call this function for every API request that needs a db connection
     '''
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def getAsyncSession():
+    '''
+    Async counterpart of getSession for async endpoints.
+    Objects stay readable after commit, response models are built from them once the handler returns.
+    '''
+    async with AsyncSession(asyncEngine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,53 @@
+import json
+import os
+import socket
+import uuid
+
+'''
+Names shared by the worker (publishing) and the API nodes (delivering) for meal events.
+Every API node has its own Redis stream and records in Redis which users it holds sockets for,
+so the worker only sends an event to the nodes that can actually deliver it.
+A node reads its stream through a consumer group and acknowledges an entry only once it has
+been sent, so an entry read but not delivered (e.g. across a Redis reconnect) is read again.
+A node is one API process: its sockets die with it, so a restarted process starts a new stream
+under a new id and the old stream simply expires.
+'''
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_URL = f"redis://{REDIS_HOST}:6379/0"
+
+# one id per API process (uvicorn workers each hold their own sockets), only set NODE_ID for a single-process node
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+# a node refreshes its registry entries well inside this. Each (user, node) entry carries its own
+# refresh time, the publisher ignores and prunes entries older than this, so a node that died
+# stops receiving events even while the user stays connected to other nodes
+CONNECTION_REGISTRY_TTL_SECONDS = int(os.getenv("CONNECTION_REGISTRY_TTL_SECONDS", "120"))
+
+# larger suggestion payloads are not pushed, the client gets the bare ping and fetches /proactiveMeals/
+WS_PAYLOAD_MAX_BYTES = int(os.getenv("WS_PAYLOAD_MAX_BYTES", "65536"))
+
+MEAL_READY_PING = '{"event":"meal_ready"}'
+HEARTBEAT_PING = '{"event":"ping"}'
+
+def buildSocketPayload(mealWindow, suggestionsJson):
+    '''
+    The exact text a socket receives for a freshly generated meal.
+    suggestionsJson was validated when it came back from the LLM, it is spliced in as-is instead of re-encoded.
+    '''
+    if not suggestionsJson or len(suggestionsJson) > WS_PAYLOAD_MAX_BYTES:
+        return MEAL_READY_PING
+    return f'{{"event":"meal_ready","mealWindow":{json.dumps(mealWindow)},"suggestions":{suggestionsJson}}}'
+
+def registryKey(userId):
+    # sorted set of node ids holding at least one socket for the user, scored by the node's last refresh (unix time)
+    return f"ws:nodes:{userId}"
+
+# approximate cap on each node's stream, a node that falls this far behind loses the oldest events
+EVENT_STREAM_MAX_LEN = int(os.getenv("EVENT_STREAM_MAX_LEN", "100000"))
+# streams of processes that are gone expire once nothing has been added for this long
+EVENT_STREAM_TTL_SECONDS = int(os.getenv("EVENT_STREAM_TTL_SECONDS", "86400"))
+EVENT_CONSUMER_GROUP = "api"
+
+def nodeStream(nodeId):
+    return f"mealGenerated:stream:{nodeId}"
@@ -1,37 +1,186 @@
 import asyncio
-import json
 import os
+import random
+import time
 import redis.asyncio as redis
+from app import eventRouting
 from app.websocketManager import manager
 from app.logger import get_logger
 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_URL=f"redis://{REDIS_HOST}:6379/0"
-
 logger = get_logger("events")
 
+'''
+The listener reads this node's Redis stream through a consumer group and hands the events
+to a bounded queue, a pool of sender coroutines drains the queue into the sockets.
+A slow or stalled client then only holds up one sender (and only up to WS_SEND_TIMEOUT_SECONDS),
+never the reader. The reader never asks for more entries than the queue has room for,
+so a backlog waits in the stream instead of in memory.
+Entries are acknowledged (in batches, by eventAcker) only after the send to the user's sockets
+finished. After a Redis reconnect the reader goes through its pending list again, skipping what is
+still queued or being sent here, so nothing read before the connection dropped is lost.
+Entries still in memory when the process dies are lost with its sockets, those clients
+refetch /proactiveMeals/ when they reconnect.
+'''
+
+EVENT_QUEUE_MAX_SIZE = int(os.getenv("EVENT_QUEUE_MAX_SIZE", "10000"))
+EVENT_SENDER_COUNT = int(os.getenv("EVENT_SENDER_COUNT", "32"))
+EVENT_STREAM_BATCH_SIZE = int(os.getenv("EVENT_STREAM_BATCH_SIZE", "500"))
+EVENT_STREAM_BLOCK_MS = int(os.getenv("EVENT_STREAM_BLOCK_MS", "5000"))
+EVENT_ACK_INTERVAL_SECONDS = float(os.getenv("EVENT_ACK_INTERVAL_SECONDS", "0.1"))
+REDIS_RECONNECT_MAX_BACKOFF_SECONDS = float(os.getenv("REDIS_RECONNECT_MAX_BACKOFF_SECONDS", "30"))
+
+eventQueue = asyncio.Queue(maxsize=EVENT_QUEUE_MAX_SIZE)
+
+# entry ids queued or being sent, until their XACK went through
+inFlightIds = set()
+# entry ids whose send finished, acknowledged by eventAcker
+pendingAcks = []
+
+listenerStats = {
+    "received": 0,
+    "acked": 0,
+    "throttled": 0,
+    "delivered": 0,
+    "reconnects": 0,
+    "totalDeliveryLatencyMs": 0.0,
+    "maxDeliveryLatencyMs": 0.0
+}
+
+async def ensureConsumerGroup(r, stream):
+    try:
+        # "0" so entries added before the group existed are delivered too
+        await r.xgroup_create(stream, eventRouting.EVENT_CONSUMER_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+def enqueueEntries(entries):
+    receivedAt = time.monotonic()
+    for entryId, fields in entries:
+        if entryId in inFlightIds:
+            continue
+        inFlightIds.add(entryId)
+        # entries trimmed from the stream while still pending come back without fields
+        if not fields:
+            pendingAcks.append(entryId)
+            continue
+        listenerStats["received"] += 1
+        eventQueue.put_nowait((entryId, int(fields["userId"]), fields["payload"], receivedAt))
+
 async def redisListener():
-    logger.info("Connecting to Redis", extra={"url": REDIS_URL})
-    try: 
+    '''
+    Reads only this node's stream. The worker routes each event to the nodes
+    that registered a socket for the user, so nothing here is spent on users connected elsewhere.
+    Starts with this node's pending (read but unacknowledged) entries, then reads new ones.
+    Reconnects with exponential backoff (plus jitter) whenever the connection drops.
+    '''
+    stream = eventRouting.nodeStream(eventRouting.NODE_ID)
+    backoff = 1.0
+
+    while True:
+        r = None
+        try:
+            logger.info("Connecting to Redis", extra={"url": eventRouting.REDIS_URL, "node_id": eventRouting.NODE_ID})
+            r = redis.from_url(eventRouting.REDIS_URL, decode_responses=True)
+            await ensureConsumerGroup(r, stream)
 
-        r = redis.from_url(REDIS_URL, decode_responses=True)
-        pubsub = r.pubsub()
-        await pubsub.subscribe("mealGenerated")
+            logger.info("Reading node event stream", extra={"stream": stream})
+            backoff = 1.0
+            lastId = "0"
 
-        logger.info("Successfully subscribed to mealGenerated channel")
+            while True:
+                room = EVENT_QUEUE_MAX_SIZE - eventQueue.qsize()
+                if room <= 0:
+                    listenerStats["throttled"] += 1
+                    await asyncio.sleep(0.05)
+                    continue
 
-        async for message in pubsub.listen():
-            if message["type"] == "message":
-                print(f"[REDIS-LISTENER] Received message: {message['data']}")
+                response = await r.xreadgroup(
+                    eventRouting.EVENT_CONSUMER_GROUP, eventRouting.NODE_ID, {stream: lastId},
+                    count=min(EVENT_STREAM_BATCH_SIZE, room), block=EVENT_STREAM_BLOCK_MS
+                )
+                entries = response[0][1] if response else []
+
+                if not entries:
+                    # pending list is drained, from here on only new entries
+                    lastId = ">"
+                    continue
+
+                if lastId != ">":
+                    # walking the pending list, continue after the last entry seen
+                    lastId = entries[-1][0]
+
+                logger.info("Meal Ready Events Received", extra={"event_count": len(entries)})
+                enqueueEntries(entries)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            listenerStats["reconnects"] += 1
+            delay = backoff + random.uniform(0, backoff / 2)
+            logger.error(f"Redis Connection Failed, retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, REDIS_RECONNECT_MAX_BACKOFF_SECONDS)
+        finally:
+            if r is not None:
                 try:
-                    data = json.loads(message["data"])
-                    userId = data["userId"]
+                    await r.aclose()
+                except Exception:
+                    pass
+
+async def eventSender():
+    while True:
+        entryId, userId, payload, receivedAt = await eventQueue.get()
+        try:
+            await manager.sendToUser(userId, payload)
+
+            latencyMs = (time.monotonic() - receivedAt) * 1000
+            listenerStats["delivered"] += 1
+            listenerStats["totalDeliveryLatencyMs"] += latencyMs
+            listenerStats["maxDeliveryLatencyMs"] = max(listenerStats["maxDeliveryLatencyMs"], latencyMs)
+        except Exception as e:
+            logger.error(f"Error delivering event: {str(e)}", extra={"user_id": userId})
+        finally:
+            # a send that failed won't succeed on a retry either, the socket has been dropped
+            pendingAcks.append(entryId)
+            eventQueue.task_done()
+
+async def eventAcker():
+    '''
+    Acknowledges finished sends in one XACK per interval instead of a round-trip per event.
+    '''
+    stream = eventRouting.nodeStream(eventRouting.NODE_ID)
+    r = redis.from_url(eventRouting.REDIS_URL, decode_responses=True)
+    while True:
+        await asyncio.sleep(EVENT_ACK_INTERVAL_SECONDS)
+        if not pendingAcks:
+            continue
+
+        entryIds = pendingAcks[:]
+        try:
+            await r.xack(stream, eventRouting.EVENT_CONSUMER_GROUP, *entryIds)
+        except Exception as e:
+            # left in pendingAcks, retried on the next interval
+            logger.warning(f"Failed to acknowledge events: {str(e)}", extra={"event_count": len(entryIds)})
+            continue
+
+        del pendingAcks[:len(entryIds)]
+        inFlightIds.difference_update(entryIds)
+        listenerStats["acked"] += len(entryIds)
 
-                    logger.info("Meal Ready Event Received", extra={"user_id": userId})
-                    await manager.sendToUser(userId)
-                except Exception as e:
-                    logger.error(f"Error processing message: {str(e)}")
-    
-    except Exception as e:
-        logger.critical(f"Redis Connection Failed: {str(e)}")
+def eventSenders():
+    return [eventSender() for _ in range(EVENT_SENDER_COUNT)] + [eventAcker()]
 
+def getMetrics():
+    delivered = listenerStats["delivered"]
+    return {
+        "queueDepth": eventQueue.qsize(),
+        "queueMaxSize": EVENT_QUEUE_MAX_SIZE,
+        "received": listenerStats["received"],
+        "acked": listenerStats["acked"],
+        "throttled": listenerStats["throttled"],
+        "delivered": delivered,
+        "reconnects": listenerStats["reconnects"],
+        "avgDeliveryLatencyMs": round(listenerStats["totalDeliveryLatencyMs"] / delivered, 1) if delivered else 0.0,
+        "maxDeliveryLatencyMs": round(listenerStats["maxDeliveryLatencyMs"], 1)
+    }
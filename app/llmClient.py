@@ -0,0 +1,79 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from datetime import datetime
+from app.logger import get_logger
+
+logger = get_logger("llm_client")
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "200"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+
+class AsyncLlmClient:
+    '''
+    Runs Gemini calls on a single asyncio event loop owned by a daemon thread.
+    There is one loop (and one semaphore) per process, so every caller in the process,
+    whatever thread it runs on, shares the same in-flight limit.
+    Sync code (celery tasks) hands prompts over with generateMany and blocks only on the results,
+    while the loop keeps hundreds of requests open at once.
+    '''
+    def __init__(self, model, maxInFlight: int = LLM_MAX_IN_FLIGHT) -> None:
+        self.model = model
+        self.maxInFlight = maxInFlight
+        self.inFlight = 0
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._semaphore = None
+        self._pid = None
+
+    def _ensureLoop(self):
+        with self._lock:
+            # celery prefork children inherit the object but not the thread running the loop
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True)
+                thread.start()
+
+                self._loop = loop
+                self._semaphore = asyncio.Semaphore(self.maxInFlight)
+                self._pid = os.getpid()
+                self.inFlight = 0
+                logger.info("Started async LLM client loop", extra={"max_in_flight": self.maxInFlight})
+
+        return self._loop
+
+    async def generate(self, prompt: str) -> str:
+        async with self._semaphore:
+            self.inFlight += 1
+            try:
+                startTime = datetime.utcnow()
+                response = await self.model.generate_content_async(prompt)
+                duration = (datetime.utcnow() - startTime).total_seconds()
+
+                logger.info("Gemini async response received", extra={"duration_seconds": duration, "in_flight": self.inFlight})
+                return response.text
+            finally:
+                self.inFlight -= 1
+
+    def generateMany(self, prompts, timeout: float = LLM_REQUEST_TIMEOUT_SECONDS):
+        '''
+        Submits every prompt to the loop at once and waits for all of them.
+        Returns one entry per prompt, in order: the response text, or the exception that call raised.
+        '''
+        loop = self._ensureLoop()
+        futures = [asyncio.run_coroutine_threadsafe(self.generate(prompt), loop) for prompt in prompts]
+        concurrent.futures.wait(futures, timeout=timeout)
+
+        results = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                results.append(TimeoutError(f"LLM call did not finish within {timeout}s"))
+            elif future.exception():
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+
+        return results
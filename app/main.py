@@ -1,18 +1,25 @@
 import asyncio
 from urllib import response
-from app.database import createDbAndTables, getSession
-from fastapi import FastAPI, Depends, status, HTTPException, WebSocket
+from app.database import createDbAndTables, getSession, getAsyncSession, getPoolMetrics
+from fastapi import FastAPI, Depends, status, HTTPException, WebSocket, WebSocketDisconnect, Response, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from sqlmodel import Session
-from typing import List
-from app.events import redisListener
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Literal, Optional
+import app.events as events
 import app.models as models
 import app.crud as crud
+import app.asyncCrud as asyncCrud
 import app.services as services
+import app.bulkImport as bulkImport
+import app.recipeCache as recipeCache
+import app.mealResponseCache as mealResponseCache
+from worker import schedulerShards
 from app.websocketManager import manager
 import app.security as security
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 from app.logger import get_logger, requestIdContext
 import uuid
 
@@ -29,17 +36,19 @@ class RequestIDMiddleware(BaseHTTPMiddleware):
         finally:
             requestIdContext.reset(token)
 
+class RawJsonResponse(Response):
+    '''
+    For bodies that are already serialized JSON bytes, sent without validation or re-encoding.
+    '''
+    media_type = "application/json"
+
 app = FastAPI()
 
 origins = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
     "http://192.168.0.18:3000",
-<<<<<<< HEAD
-    "smart-pantry-liard.vercel.app",
-=======
     "https://smart-pantry-liard.vercel.app",
->>>>>>> 88c7569 (-Added logging -Fixed bugs related to meal triggers and old meal cleanups -Other code cleanup)
 ]
 
 app.add_middleware(RequestIDMiddleware)
@@ -66,11 +75,17 @@ def startup():
 @app.on_event("startup")
 async def startRedisListener():
     logger.info("Starting Redis Listener background task...")
-    task = asyncio.create_task(redisListener())
-    backgroundTasks.add(task)
-    task.add_done_callback(backgroundTasks.discard)
+    for coroutine in (events.redisListener(), *events.eventSenders(), manager.refreshRegistry(), manager.heartbeat()):
+        task = asyncio.create_task(coroutine)
+        backgroundTasks.add(task)
+        task.add_done_callback(backgroundTasks.discard)
     logger.info("Redis Listener attached to background tasks.")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await manager.unregisterAll()
+    security.shutdownPasswordExecutor()
+
 def getUserId():
     return 1
 
@@ -80,7 +95,7 @@ async def websocketEndpoint(websocket: WebSocket):
 
     try:
         userId = security.decodeJwt(token)
-    except:
+    except Exception as e:
         logger.warning(f"WebSocket connection rejected: Invalid token. Error: {str(e)}")
         await websocket.close()
         return
@@ -89,19 +104,27 @@ async def websocketEndpoint(websocket: WebSocket):
     logger.info("WebSocket connected", extra={"user_id": userId})
 
     try:
+        # clients only send heartbeat pongs, reading them is how a dropped connection gets noticed
         while True:
-            await asyncio.sleep(3600)
+            await websocket.receive_text()
+            manager.markSeen(websocket)
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected", extra={"user_id": userId})
-        await manager.disconnect(userId)
     except Exception as e:
         logger.error(f"WebSocket unexpected error: {str(e)}", extra={"user_id": userId})
-        await manager.disconnect(userId)
+    finally:
+        await manager.disconnect(userId, websocket)
 
 @app.post("/user/register/", response_model=models.UserRead, status_code=status.HTTP_201_CREATED)
-def createUserEndpoint(userData: models.UserCreate, session: Session = Depends(getSession)):
+async def createUserEndpoint(userData: models.UserCreate, session: Session = Depends(getSession)):
     try:
-        newUser = services.registerNewUser(session, userData)
+        # checked before hashing so a duplicate email doesn't cost a bcrypt round, registerNewUser checks again
+        if await run_in_threadpool(crud.getUserByEmail, session, userData.email):
+            logger.warning("Registration failed: Email already exists", extra={"email": userData.email})
+            raise HTTPException(400, "Email already exists")
+
+        hashedPassword = await security.getHashedPasswordAsync(userData.password)
+        newUser = await run_in_threadpool(services.registerNewUser, session, userData, hashedPassword)
         logger.info("User registered successfully", extra={"user_id": newUser.id})
         return newUser
     except Exception as e:
@@ -109,8 +132,8 @@ def createUserEndpoint(userData: models.UserCreate, session: Session = Depends(g
         raise e
 
 @app.post("/user/login/", response_model=models.LoginResponse)
-def loginUserEndpoint(userCredentials: models.UserLogin, session: Session = Depends(getSession)):
-    loggedUser = crud.authenticateUser(session, userCredentials)
+async def loginUserEndpoint(userCredentials: models.UserLogin, session: AsyncSession = Depends(getAsyncSession)):
+    loggedUser = await services.authenticateUser(session, userCredentials)
 
     if not loggedUser:
         logger.warning("Failed login attempt", extra={"email": userCredentials.email})
@@ -133,9 +156,9 @@ def loginUserEndpoint(userCredentials: models.UserLogin, session: Session = Depe
     
 
 @app.get("/user/me", response_model=models.UserRead)
-def getUserEndpoint(session: Session = Depends(getSession), userId = Depends(security.verifyJwt)):
+async def getUserEndpoint(session: AsyncSession = Depends(getAsyncSession), userId = Depends(security.verifyJwt)):
 
-    existingUser = crud.getUser(session, userId)
+    existingUser = await services.getUserPrincipal(session, userId)
 
     if not existingUser:
         logger.warning("User/me requested for non-existent user", extra={"user_id": userId})
@@ -147,9 +170,9 @@ def getUserEndpoint(session: Session = Depends(getSession), userId = Depends(sec
     return existingUser
 
 @app.post("/pantry", response_model=models.PantryRead, status_code=status.HTTP_201_CREATED)
-def createPantryEndpoint(pantryData: models.PantryCreate, session: Session = Depends(getSession), userId: int = Depends(security.verifyJwt)):
+async def createPantryEndpoint(pantryData: models.PantryCreate, session: AsyncSession = Depends(getAsyncSession), userId: int = Depends(security.verifyJwt)):
     logger.info("Creating new pantry", extra={"user_id": userId, "pantry_name": pantryData.pantryNickname})
-    pantryForUser = crud.getPantryByNameAndUser(session, userId, pantryData.pantryNickname)
+    pantryForUser = await asyncCrud.getPantryByNameAndUser(session, userId, pantryData.pantryNickname)
 
     if pantryForUser:
         logger.warning("Pantry creation failed: Name collision", extra={"user_id": userId, "pantry_name": pantryData.pantryNickname})
@@ -158,33 +181,94 @@ def createPantryEndpoint(pantryData: models.PantryCreate, session: Session = Dep
             detail="Pantry with name already exists for user"
         )
     
-    newPantry = crud.createPantryForUser(session, userId, pantryData)
+    newPantry = await asyncCrud.createPantryForUser(session, userId, pantryData)
 
     return newPantry
 
 @app.get("/pantries", response_model=list[models.PantryRead])
-def getPantriesEndpoint(session: Session = Depends(getSession), userId: int = Depends(security.verifyJwt)):
+async def getPantriesEndpoint(session: AsyncSession = Depends(getAsyncSession), userId: int = Depends(security.verifyJwt)):
 
-    pantriesForUser = crud.getPantriesForUser(session, userId)
+    pantriesForUser = await asyncCrud.getPantriesForUser(session, userId)
     return pantriesForUser
 
 @app.post("/pantry/{pantryId}/item", response_model=models.PantryItemReadWithItem, status_code=status.HTTP_201_CREATED)
-def addPantryItemEndpoint(pantryId: int, pantryItemData: models.PantryItemCreate, session: Session = Depends(getSession), userId: int = Depends(security.verifyJwt)):
-    if not crud.getSecurePantry(session, pantryId, userId):
+async def addPantryItemEndpoint(pantryId: int, pantryItemData: models.PantryItemCreate, session: AsyncSession = Depends(getAsyncSession), userId: int = Depends(security.verifyJwt)):
+    if not await asyncCrud.getSecurePantry(session, pantryId, userId):
         logger.warning("Unauthorized pantry access attempt", extra={"user_id": userId, "pantry_id": pantryId})
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Pantry does not belong to current user"
         )
 
-    pantryItem = crud.addItemToPantry(session, pantryItemData, pantryId)
+    pantryItem = await asyncCrud.addItemToPantry(session, pantryItemData, pantryId)
     logger.info("Item added to pantry", extra={"user_id": userId, "pantry_id": pantryId, "item_id": pantryItem.itemId})
     return pantryItem
 
-@app.get("/{pantryId}/items", response_model=list[models.PantryItemReadWithItem])
-def getItemsForPantryEndpoint(pantryId: int, session: Session = Depends(getSession), userId: int = Depends(security.verifyJwt)):
+@app.post("/pantry/{pantryId}/items/bulk", response_model=models.BulkImportResponse, status_code=status.HTTP_200_OK)
+async def bulkImportPantryItemsEndpoint(pantryId: int, request: Request, session: AsyncSession = Depends(getAsyncSession), userId: int = Depends(security.verifyJwt)):
+    '''
+    Body is a JSON array, NDJSON or CSV (header row first) of PantryItemCreate rows.
+    Rows that don't validate are listed in errors, the rest are imported.
+    '''
+    if not await asyncCrud.getSecurePantry(session, pantryId, userId):
+        logger.warning("Unauthorized pantry access attempt", extra={"user_id": userId, "pantry_id": pantryId})
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pantry does not belong to current user"
+        )
+
+    try:
+        rows, errors = await bulkImport.parseRows(
+            request.headers.get("content-type", ""), request.stream(), request.headers.get("content-length")
+        )
+    except bulkImport.BulkImportTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    imported = await asyncCrud.bulkAddItemsToPantry(session, pantryId, rows) if rows else 0
+
+    logger.info("Bulk pantry import completed", extra={"user_id": userId, "pantry_id": pantryId, "imported": imported, "failed": len(errors)})
+    return models.BulkImportResponse(imported=imported, failed=len(errors), errors=errors)
+
+@app.get("/pantry/{pantryId}/items", response_model=models.PantryItemPage)
+async def getPantryItemsPageEndpoint(
+    pantryId: int,
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sortBy: Literal["id", "purchaseDate"] = "id",
+    fields: Optional[str] = Query(default=None, description="Comma separated subset of " + ",".join(asyncCrud.PANTRY_ITEM_FIELDS)),
+    session: AsyncSession = Depends(getAsyncSession),
+    userId: int = Depends(security.verifyJwt)
+):
+    if not await asyncCrud.getSecurePantry(session, pantryId, userId):
+        logger.warning("Unauthorized pantry view attempt", extra={"user_id": userId, "pantry_id": pantryId})
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pantry does not belong to current user"
+        )
+
+    requestedFields = None
+    if fields:
+        requestedFields = [name.strip() for name in fields.split(",") if name.strip()]
+        unknownFields = set(requestedFields) - set(asyncCrud.PANTRY_ITEM_FIELDS)
+        if unknownFields:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(sorted(unknownFields))}")
+
+    try:
+        after = services.decodeItemCursor(cursor, sortBy) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    items, nextKey = await asyncCrud.getPantryItemsPage(session, pantryId, limit, sortBy, after, requestedFields)
+    nextCursor = services.encodeItemCursor(sortBy, nextKey) if nextKey else None
+    return models.PantryItemPage(items=items, nextCursor=nextCursor)
+
+# unpaginated, kept for older clients, use GET /pantry/{pantryId}/items
+@app.get("/{pantryId}/items", response_model=list[models.PantryItemReadWithItem], deprecated=True)
+async def getItemsForPantryEndpoint(pantryId: int, session: AsyncSession = Depends(getAsyncSession), userId: int = Depends(security.verifyJwt)):
     
-    pantry = crud.getSecurePantry(session, pantryId, userId)
+    pantry = await asyncCrud.getSecurePantry(session, pantryId, userId)
     if not pantry:
         logger.warning("Unauthorized pantry view attempt", extra={"user_id": userId, "pantry_id": pantryId})
         raise HTTPException(
@@ -192,7 +276,7 @@ def getItemsForPantryEndpoint(pantryId: int, session: Session = Depends(getSessi
             detail="Pantry does not belong to current user"
         )
 
-    return pantry.pantryItems
+    return await asyncCrud.getItemsForPantry(session, pantryId)
 
 @app.post("/pantry/suggestMeal", response_model=models.RecipeSuggestions, status_code=status.HTTP_200_OK)
 def requestRecipeSuggestionEndpoint(userSuggestions: models.MealRequestPriorityItems, session: Session = Depends(getSession), userId: int = Depends(security.verifyJwt)):
@@ -211,10 +295,29 @@ def deductIngredientsFromDb(ingredients: List[models.Ingredient], session: Sessi
     logger.info("Inventory deduction completed", extra={"user_id": userId})
     return 
 
-@app.get("/proactiveMeals/", response_model=models.ProactiveMealResponse)
-def getCurrentMealSuggestions(session: Session = Depends(getSession), userId: int = Depends(security.verifyJwt)):
-    proactiveMealResponse = crud.getCurrentMeals(session, userId)
-    return proactiveMealResponse.model_dump(exclude_none=False)
+@app.get("/proactiveMeals/", response_model=models.ProactiveMealResponse, response_class=RawJsonResponse)
+async def getCurrentMealSuggestions(session: AsyncSession = Depends(getAsyncSession), userId: int = Depends(security.verifyJwt)):
+    # the cached body is already the serialized response, it goes out as-is
+    cachedBody, version = await mealResponseCache.getCachedBody(userId)
+    if cachedBody is not None:
+        return RawJsonResponse(cachedBody)
+
+    mealRows = await asyncCrud.getCurrentMealFragments(session, userId)
+    body = mealResponseCache.stitchResponseBody(mealRows)
+    await mealResponseCache.storeBody(userId, version, body)
+    return RawJsonResponse(body)
+
+@app.get("/metrics", status_code=status.HTTP_200_OK, dependencies=[Depends(security.verifyMetricsToken)])
+def getMetricsEndpoint():
+    return {
+        "recipeCache": recipeCache.getStats(),
+        "tokenCache": security.tokenCache.getStats(),
+        "userCache": services.userPrincipalCache.getStats(),
+        "schedulerShards": schedulerShards.getShardMetrics(),
+        "websockets": manager.getMetrics(),
+        "eventListener": events.getMetrics(),
+        "dbPool": getPoolMetrics()
+    }
 
 
 
@@ -0,0 +1,92 @@
+import os
+import redis
+import redis.asyncio as asyncRedis
+import app.models as models
+from app import eventRouting
+from app.logger import get_logger
+
+logger = get_logger("meal_response_cache")
+
+'''
+Per-user cache of the serialized GET /proactiveMeals/ response body.
+The API fills it on a miss, workers invalidate it after they commit a change to the user's meals.
+Every invalidation bumps a per-user version, and the API only writes a body if the version is
+still the one it saw before reading the DB, so a fill racing with a new meal can't park stale data.
+The TTL is only a safety net.
+On a miss the body is stitched together from the stored suggestionsJson text of each meal,
+which was validated when it came back from the LLM, so no meal is parsed or re-encoded on the way out.
+'''
+
+MEAL_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("MEAL_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+redisClient = redis.Redis(host=eventRouting.REDIS_HOST, port=6379, db=0)
+asyncRedisClient = asyncRedis.from_url(eventRouting.REDIS_URL)
+
+STORE_IF_CURRENT_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or '0'
+if version == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+MEAL_RESPONSE_WINDOWS = list(models.ProactiveMealResponse.model_fields)
+
+def stitchResponseBody(mealRows):
+    '''
+    mealRows is [(mealWindow, suggestionsJson), ...], later rows win for the same window.
+    Produces the same JSON as ProactiveMealResponse, every window present and null when there is no meal.
+    '''
+    fragments = dict.fromkeys(MEAL_RESPONSE_WINDOWS, "null")
+    for mealWindow, suggestionsJson in mealRows:
+        if mealWindow in fragments:
+            fragments[mealWindow] = suggestionsJson
+
+    return ("{" + ",".join(f'"{window}":{fragment}' for window, fragment in fragments.items()) + "}").encode("utf-8")
+
+def _bodyKey(userId):
+    return f"proactiveMeals:body:{userId}"
+
+def _versionKey(userId):
+    return f"proactiveMeals:version:{userId}"
+
+async def getCachedBody(userId):
+    '''
+    Returns (body, version). body is the cached bytes or None,
+    version is what storeBody needs to fill the cache after a miss.
+    '''
+    try:
+        body, version = await asyncRedisClient.mget(_bodyKey(userId), _versionKey(userId))
+    except redis.RedisError as e:
+        logger.warning(f"Meal response cache read failed: {str(e)}", extra={"user_id": userId})
+        return None, None
+    return body, (version or b"0").decode()
+
+async def storeBody(userId, version, body):
+    if version is None:
+        return
+    try:
+        await asyncRedisClient.eval(
+            STORE_IF_CURRENT_SCRIPT, 2, _bodyKey(userId), _versionKey(userId),
+            version, body, MEAL_RESPONSE_CACHE_TTL_SECONDS
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Meal response cache write failed: {str(e)}", extra={"user_id": userId})
+
+def invalidateUsers(userIds):
+    '''
+    Call after the commit that changed these users' meals.
+    '''
+    if not userIds:
+        return
+    try:
+        pipe = redisClient.pipeline(transaction=False)
+        for userId in userIds:
+            pipe.incr(_versionKey(userId))
+            pipe.expire(_versionKey(userId), MEAL_RESPONSE_CACHE_TTL_SECONDS)
+            pipe.delete(_bodyKey(userId))
+        pipe.execute()
+    except redis.RedisError as e:
+        # bodies written before the change outlive it by at most the TTL
+        logger.error(f"Meal response cache invalidation failed: {str(e)}", extra={"user_count": len(userIds)})
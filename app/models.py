@@ -2,7 +2,7 @@ from dataclasses import field
 from datetime import datetime, time
 from xmlrpc.client import boolean
 from sqlmodel import SQLModel, Field, Relationship, Index
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 
 '''
 Different classes for user and their use cases.
@@ -94,6 +94,10 @@ class Item(ItemBase, table=True):
     which is an attr common to an item regardless of the pantry it belongs to
     in futuree if there are more fields native to an item, add here
     '''
+    # one catalog row per (itemName, brand), a missing brand counts as a value of its own (postgres 15+).
+    # existing databases get it from database.ensureItemUniqueIndex, create_all never adds it to an existing table
+    __table_args__ = (Index("uq_item_name_brand", "itemName", "brand", unique=True, postgresql_nulls_not_distinct=True), )
+
     itemId: Optional[int] = Field(default=None, primary_key=True)
     itemName: Optional[str] = Field(index=True)
     avgShelfLife: Optional[int]
@@ -128,6 +132,12 @@ class PantryItem(PantryItemBase, table=True):
     Defines the many-to-many relationship 
     between pantry and item
     '''
+    # keyset pagination of a pantry's items, by id or by (purchaseDate, id)
+    __table_args__ = (
+        Index("idx_pantryitem_pantry_id", "pantryId", "id"),
+        Index("idx_pantryitem_pantry_purchase", "pantryId", "purchaseDate", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     purchaseDate: datetime = Field(default_factory=datetime.utcnow)
 
@@ -158,6 +168,23 @@ class PantryItemRead(PantryItemBase):
 class PantryItemReadWithItem(PantryItemRead):
     item: ItemRead
 
+class PantryItemPage(SQLModel):
+    '''
+    items hold only the requested fields, "item" is the nested catalog row.
+    nextCursor is passed back as cursor for the following page, null on the last page.
+    '''
+    items: List[Dict[str, Any]]
+    nextCursor: Optional[str] = None
+
+class BulkImportRowError(SQLModel):
+    row: int
+    error: str
+
+class BulkImportResponse(SQLModel):
+    imported: int
+    failed: int
+    errors: List[BulkImportRowError]
+
 class MealRequestPriorityItems(SQLModel):
     priorityPantryItemIds: Optional[List[int]] = Field(default_factory=list)
     priorityPantryIds: Optional[List[int]] = Field(default_factory=list)
@@ -185,6 +212,13 @@ class Recipe(SQLModel):
 class RecipeSuggestions(SQLModel):
     recipes: List[Recipe]
 
+class UserRecipeSuggestions(SQLModel):
+    userId: int = Field(description="The id of the user block these recipes were planned for")
+    recipes: List[Recipe]
+
+class BatchRecipeSuggestions(SQLModel):
+    users: List[UserRecipeSuggestions]
+
 class IngredientUsage(SQLModel):
     pantryItemId: int
     quantityUsed: float
@@ -195,7 +229,7 @@ class IngredientUsage(SQLModel):
 class IngredientDeduction(SQLModel):
     pantryItemId: int
     quantityRemaining: float
-    unit: str
+    unit: Optional[str]
 
 class OutputIngredientDeduction(SQLModel):
     ingredientsUsed: List[IngredientDeduction]
@@ -0,0 +1,187 @@
+import json
+import re
+import app.models as models
+
+'''
+Prompt text for every LLM call.
+Everything static (instructions, output schemas) is rendered once at import,
+a prompt is built by appending only the per-request data to those pre-rendered blocks.
+Ingredient lists go out as a header row plus one "|"-separated row per item instead of
+pretty-printed JSON objects, which repeats every key and indent on every item.
+'''
+
+def _minifiedSchema(model):
+    return json.dumps(model.model_json_schema(), separators=(",", ":"))
+
+RECIPE_SCHEMA_JSON = _minifiedSchema(models.RecipeSuggestions)
+BATCH_RECIPE_SCHEMA_JSON = _minifiedSchema(models.BatchRecipeSuggestions)
+DEDUCTION_SCHEMA_JSON = _minifiedSchema(models.OutputIngredientDeduction)
+
+ITEM_COLUMNS = ["pantryItemId", "ingredientName", "ingredientBrand", "quantity", "unit", "daysOwned"]
+USAGE_COLUMNS = ["pantryItemId", "quantityUsed", "unitQtyUsed", "qtyInDb", "unitInDb"]
+
+def _encodeValue(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def encodeRow(row, columns):
+    return "|".join(_encodeValue(row.get(column)) for column in columns)
+
+def encodeTable(rows, columns=ITEM_COLUMNS):
+    '''
+    [{"pantryItemId": 24, "ingredientName": "Chicken Breast", ...}, ...] ->
+    pantryItemId|ingredientName|ingredientBrand|quantity|unit|daysOwned
+    24|Chicken Breast|Kroger|2|lbs|3
+    '''
+    lines = ["|".join(columns)]
+    lines.extend(encodeRow(row, columns) for row in rows)
+    return "\n".join(lines)
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|\s*\n\s*|\s{2,}|[^\sA-Za-z\d]")
+
+def estimateTokens(text):
+    '''
+    Rough BPE token count without a tokenizer dependency:
+    words cost one token per ~4 letters, numbers one per ~3 digits,
+    every punctuation mark and every run of newlines/indentation costs one.
+    '''
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        if piece[0].isalpha():
+            count += (len(piece) + 3) // 4
+        elif piece[0].isdigit():
+            count += (len(piece) + 2) // 3
+        else:
+            count += 1
+    return count
+
+RECIPE_PROMPT_INSTRUCTIONS = """<task>
+You are a meal-planning assistant. Your goals are:
+1. Reduce food waste by prioritizing expiring items.
+2. Suggest meals that taste normal and are easy to cook.
+3. Respect realistic ingredient pairings and quantities.
+</task>
+<rules>
+- You will receive two ingredient lists:
+  • high_priority_ingredients (close to expiry OR user-selected)
+  • normal_priority_ingredients (everything else)
+- Some ingredients may appear in BOTH lists — treat them as high priority.
+- You must suggest EXACTLY 3 meal ideas.
+- A “meal” may be:
+  • A normal cooked recipe using raw ingredients
+  • A ready-to-eat item (e.g., frozen pizza)
+  • A main dish + a simple side
+- Do NOT force ingredients together if they don’t fit. Taste > using everything.
+- Pantry staples like oil, salt, pepper, garlic powder can be assumed available.
+- You should maximize:
+  1. Use of high-priority items
+  2. Meal quality
+  3. Efficient pantry usage across the day
+- When referencing pantry ingredients (anything from the input lists), you MUST include the exact pantryItemId.
+- When referencing pantry staples (oil, salt, pepper, common spices), you MUST list them as ingredients, but they DO NOT have a pantryItemId.
+- Units of measurement in the recipe MUST use common kitchen-friendly units.
+  • Examples: cups, tablespoons, teaspoons, pieces, slices, grams, ounces.
+  • Avoid units that humans cannot easily measure while cooking (e.g., “0.13 gallons”, “0.02 liters”, “0.3 pounds”).
+  • When the pantry item quantity is stored in a larger unit (e.g., "1 gallon of milk"), you are allowed to convert to smaller, more usable cooking units (e.g., “½ cup milk”).
+- Put '-1' as the pantryItemId for staples.
+</rules>
+<input_format>
+Each ingredient list is a table. The first row names the columns, every following row is one ingredient.
+Values are separated by "|", an empty value means unknown. Example:
+pantryItemId|ingredientName|ingredientBrand|quantity|unit|daysOwned
+24|Chicken Breast|Kroger|2|lbs|3
+</input_format>
+"""
+
+_OUTPUT_REQUIREMENTS = """<output_requirements>
+Your answer MUST be a single valid JSON object.
+It MUST strictly follow this schema:
+{schema}
+Do NOT explain anything.
+Do NOT add notes.
+Return ONLY the JSON object.
+</output_requirements>
+"""
+
+RECIPE_PROMPT_HEADER = RECIPE_PROMPT_INSTRUCTIONS + _OUTPUT_REQUIREMENTS.format(schema=RECIPE_SCHEMA_JSON)
+
+BATCH_RECIPE_PROMPT_HEADER = RECIPE_PROMPT_INSTRUCTIONS + """<batch_rules>
+- You will receive the pantries of several users, each inside its own <user id="..."> block.
+- Plan meals for every user independently, following all rules above for each user.
+- Only use a user's own ingredients and pantryItemIds in that user's recipes.
+- Return exactly one entry per user id, using the same userId.
+</batch_rules>
+""" + _OUTPUT_REQUIREMENTS.format(schema=BATCH_RECIPE_SCHEMA_JSON)
+
+DEDUCTION_PROMPT_HEADER = """You are an ingredient-deduction assistant for a pantry inventory system.
+Your job is to take recipe usage measurements (human-friendly units) and convert them into the standardized units used by the database. Then calculate the *new remaining quantity and the unit* for each pantry item.
+<rules>
+- Convert only using real culinary unit conversions.
+- NEVER change the intended amount (e.g., “½ cup milk” must convert correctly to mL).
+- ALWAYS convert into the database unit EXACTLY as provided in the input (unitInDb).
+- NEVER hallucinate units or pantry items.
+- If a pantryItemId is missing or the unit is not convertible, return an error object using the output schema.
+- If a pantry item is a staple with no pantryItemId, IGNORE it entirely — return no output for that item.
+- If conversion requires density assumptions, use:
+  • Water-like liquids: 1 cup = 240 mL
+  • Milk: 1 cup = 240 mL
+  • Oil: 1 cup = 240 mL
+  • Flour: 1 cup = 120 g
+  • Sugar: 1 cup = 200 g
+  • Rice (uncooked): 1 cup = 185 g
+  • Butter: 1 tablespoon = 14 g
+- If the input unit is vague (“pinch”, “dash”, “handful”), use common culinary assumptions:
+  • pinch = 0.36 g
+  • dash = 0.6 g
+  • handful = 30 g
+- Always round numerical values to at most **2 decimals**.
+- NEVER output negative remaining quantities — if usage exceeds available, set remainingQty = 0.
+- The final output must be a SINGLE JSON array following the provided schema.
+</rules>
+<task>
+For each ingredient:
+1. Convert (quantityUsed, unitQtyUsed) into the unitInDb using correct cooking conversions.
+2. Compute: remainingQty = qtyInDb - convertedUsedQty
+3. Ensure remainingQty ≥ 0.
+4. Produce an output object that matches EXACTLY this schema:
+""" + DEDUCTION_SCHEMA_JSON + """
+Return ONLY a single JSON array following the given output schema.
+Do NOT include explanations.
+Do NOT add text outside JSON.
+</task>
+<inputs>
+The input is a table, the first row names the columns and every following row is one ingredient.
+Values are separated by "|", an empty value means unknown.
+- quantityUsed + unitQtyUsed → user-friendly measurement from recipe.
+- qtyInDb + unitInDb → standardized DB storage for that item.
+"""
+
+def _ingredientSections(prioritizedItems, meal):
+    return (
+        "<high_priority_ingredients>\n"
+        + encodeTable(prioritizedItems["highPriority"])
+        + "\n</high_priority_ingredients>\n<normal_priority_ingredients>\n"
+        + encodeTable(prioritizedItems["allItems"])
+        + f"\n</normal_priority_ingredients>\n<meal_time>{meal}</meal_time>\n"
+    )
+
+def buildPrompt(prioritizedItems, meal):
+    return RECIPE_PROMPT_HEADER + _ingredientSections(prioritizedItems, meal)
+
+def buildBatchPrompt(preparedByUser):
+    '''
+    preparedByUser is {userId: (prioritizedItems, meal)}.
+    Packs every user's ingredient lists into one request, the answer comes back keyed by userId.
+    '''
+    userBlocks = [
+        f'<user id="{userId}">\n' + _ingredientSections(prioritizedItems, meal) + "</user>\n"
+        for userId, (prioritizedItems, meal) in preparedByUser.items()
+    ]
+    return BATCH_RECIPE_PROMPT_HEADER + "".join(userBlocks)
+
+def buildDeductionPrompt(ingredientInput):
+    return DEDUCTION_PROMPT_HEADER + encodeTable(ingredientInput, USAGE_COLUMNS) + "\n</inputs>\n"
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import time
+import redis
+import app.models as models
+from app.logger import get_logger
+
+logger = get_logger("recipe_cache")
+
+'''
+Content-addressed cache in front of the recipe LLM call.
+The key is a hash of the prepared prompt input (highPriority/allItems with daysOwned bucketed)
+plus the meal window, so an unchanged pantry maps to the same key across requests and triggers.
+Entries live in Redis with a TTL. A sorted set of keys by insert time bounds the number of entries,
+oldest entries are evicted first once the bound is crossed.
+'''
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+
+RECIPE_CACHE_TTL_SECONDS = int(os.getenv("RECIPE_CACHE_TTL_SECONDS", "21600"))
+RECIPE_CACHE_MAX_ENTRIES = int(os.getenv("RECIPE_CACHE_MAX_ENTRIES", "50000"))
+# daysOwned moves every day, bucketing keeps a pantry that hasn't really changed on the same key
+RECIPE_CACHE_DAYS_BUCKET = int(os.getenv("RECIPE_CACHE_DAYS_BUCKET", "3"))
+
+KEY_PREFIX = "recipeCache:entry:"
+INDEX_KEY = "recipeCache:index"
+STATS_KEY = "recipeCache:stats"
+
+redisClient = redis.Redis(host=REDIS_HOST, port=6379, db=0)
+
+def _normalizeItems(items):
+    normalized = []
+    for item in items:
+        entry = dict(item)
+        entry["daysOwned"] = entry["daysOwned"] // RECIPE_CACHE_DAYS_BUCKET
+        normalized.append(entry)
+
+    normalized.sort(key=lambda entry: entry["pantryItemId"])
+    return normalized
+
+def buildCacheKey(preparedData, mealWindow):
+    fingerprint = {
+        "highPriority": _normalizeItems(preparedData["highPriority"]),
+        "allItems": _normalizeItems(preparedData["allItems"]),
+        "mealWindow": mealWindow.lower()
+    }
+    encoded = json.dumps(fingerprint, sort_keys=True, separators=(",", ":"), default=str)
+    return KEY_PREFIX + hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def getCachedRecipes(cacheKey):
+    try:
+        cached = redisClient.get(cacheKey)
+        redisClient.hincrby(STATS_KEY, "hits" if cached else "misses", 1)
+    except redis.RedisError as e:
+        logger.warning(f"Recipe cache read failed: {str(e)}")
+        return None
+
+    if not cached:
+        return None
+
+    try:
+        return models.RecipeSuggestions.model_validate_json(cached)
+    except ValueError as e:
+        logger.warning(f"Dropping unreadable recipe cache entry: {str(e)}")
+        redisClient.delete(cacheKey)
+        return None
+
+def storeRecipes(cacheKey, recipes: models.RecipeSuggestions):
+    now = time.time()
+    try:
+        pipe = redisClient.pipeline()
+        pipe.set(cacheKey, recipes.model_dump_json(), ex=RECIPE_CACHE_TTL_SECONDS)
+        pipe.zadd(INDEX_KEY, {cacheKey: now})
+        # keys that already expired through their TTL only need to leave the index
+        pipe.zremrangebyscore(INDEX_KEY, "-inf", now - RECIPE_CACHE_TTL_SECONDS)
+        pipe.zcard(INDEX_KEY)
+        indexSize = pipe.execute()[-1]
+
+        overflow = indexSize - RECIPE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = [key for key, _ in redisClient.zpopmin(INDEX_KEY, overflow)]
+            if evicted:
+                redisClient.delete(*evicted)
+                redisClient.hincrby(STATS_KEY, "evictions", len(evicted))
+    except redis.RedisError as e:
+        logger.warning(f"Recipe cache write failed: {str(e)}")
+
+def getStats():
+    try:
+        stats = redisClient.hgetall(STATS_KEY)
+        entries = redisClient.zcard(INDEX_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Recipe cache stats unavailable: {str(e)}")
+        return {}
+
+    hits = int(stats.get(b"hits", 0))
+    misses = int(stats.get(b"misses", 0))
+    lookups = hits + misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "evictions": int(stats.get(b"evictions", 0)),
+        "entries": entries,
+        "hitRate": round(hits / lookups, 4) if lookups else 0.0
+    }
@@ -1,27 +1,17 @@
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
 import bcrypt
+from concurrent.futures import ProcessPoolExecutor
 from base64 import decode
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-<<<<<<< HEAD
-
-def getHashedPassword(password: str) -> str:
-    password_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode("utf-8")
-
-def verifyPassword(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode("utf-8"),
-        hashed_password.encode("utf-8")
-    )
-
-=======
->>>>>>> 88c7569 (-Added logging -Fixed bugs related to meal triggers and old meal cleanups -Other code cleanup)
 import jwt
 from datetime import datetime, timedelta
 import os
+from app.ttlCache import TtlLruCache
 from app.logger import get_logger
 
 logger = get_logger("security")
@@ -29,9 +19,25 @@ logger = get_logger("security")
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "REPLACE_WITH_A_REAL_SECRET") 
 ALGORITHM = "HS256"
 
+# verified tokens, keyed by a digest of the token so raw tokens are never held as keys
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "50000"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+tokenCache = TtlLruCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS)
+
+# bearer token for /metrics, which is for operators only. Unset disables the endpoint
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# bcrypt cost factor, hashes made with another cost are upgraded on the user's next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# processes doing password work, the only place bcrypt runs for request handlers
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_passwordExecutor = None
+
 def getHashedPassword(password: str) -> str:
     password_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode("utf-8")
 
@@ -41,6 +47,42 @@ def verifyPassword(plain_password: str, hashed_password: str) -> bool:
         hashed_password.encode("utf-8")
     )
 
+def needsRehash(hashed_password: str) -> bool:
+    # "$2b$12$<salt+hash>", the second field is the cost
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def getPasswordExecutor():
+    '''
+    Password hashing gets its own small process pool so a login storm queues up here
+    instead of taking every thread of FastAPI's threadpool away from the other endpoints.
+    Spawned rather than forked, the API process has running threads and an event loop.
+    '''
+    global _passwordExecutor
+    if _passwordExecutor is None:
+        _passwordExecutor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info("Started password hashing pool", extra={"workers": PASSWORD_HASH_WORKERS, "rounds": BCRYPT_ROUNDS})
+    return _passwordExecutor
+
+def shutdownPasswordExecutor():
+    global _passwordExecutor
+    if _passwordExecutor is not None:
+        _passwordExecutor.shutdown(wait=False, cancel_futures=True)
+        _passwordExecutor = None
+
+async def getHashedPasswordAsync(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(getPasswordExecutor(), getHashedPassword, password)
+
+async def verifyPasswordAsync(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(getPasswordExecutor(), verifyPassword, plain_password, hashed_password)
+
 def createJwt(userId: int):
     payload = {
         "userId": userId,
@@ -55,8 +97,19 @@ def createJwt(userId: int):
 auth_scheme = HTTPBearer()
 
 def decodeJwt(token: str):
+    '''
+    Only a token that fully verified is cached, and never past its own exp,
+    so a cache hit is exactly as trustworthy as re-verifying.
+    '''
+    tokenDigest = hashlib.sha256(token.encode("utf-8")).digest() if token else None
+    if tokenDigest:
+        cachedUserId = tokenCache.get(tokenDigest)
+        if cachedUserId is not None:
+            return cachedUserId
+
     try: 
         decoded = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        tokenCache.set(tokenDigest, decoded["userId"], expiresAt=decoded.get("exp"))
         return decoded["userId"]
     except jwt.ExpiredSignatureError:
         logger.warning("Token verification failed: Expired token")
@@ -71,8 +124,17 @@ def decodeJwt(token: str):
             detail="Invalid token."
         )
 
-def verifyJwt(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+async def verifyJwt(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    # async so async endpoints don't hop to the threadpool just to authenticate, a cache miss is one HMAC
     token = credentials.credentials
     return decodeJwt(token)
 
-
+async def verifyMetricsToken(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not hmac.compare_digest(credentials.credentials.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+        logger.warning("Metrics access with an invalid token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token."
+        )
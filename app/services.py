@@ -1,7 +1,16 @@
 import app.crud as crud
+import app.asyncCrud as asyncCrud
 import app.models as models
+import app.unitConverter as unitConverter
+import app.recipeCache as recipeCache
+import app.prompts as prompts
+import app.security as security
+from app.llmClient import AsyncLlmClient
+from app.ttlCache import TtlLruCache
 import os
 import json
+import base64
+import binascii
 from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 from pydantic import TypeAdapter, ValidationError
@@ -27,14 +36,90 @@ LLM_MODEL = genai.GenerativeModel(
     generation_config=JSON_GENERATION_CONFIG
 )
 
-def registerNewUser(session, userData: models.UserCreate):
+# shared per process, bounds how many Gemini calls the worker keeps open at once
+ASYNC_LLM_CLIENT = AsyncLlmClient(LLM_MODEL)
+
+# how many users are packed into one recipe prompt, 1 keeps one prompt per user
+LLM_USERS_PER_PROMPT = int(os.getenv("LLM_USERS_PER_PROMPT", "8"))
+LLM_BATCH_FALLBACK_TO_SINGLE = os.getenv("LLM_BATCH_FALLBACK_TO_SINGLE", "true").lower() == "true"
+
+# token budget for the ingredient lists of one user's prompt, 0 sends the whole pantry
+PROMPT_ITEM_TOKEN_BUDGET = int(os.getenv("PROMPT_ITEM_TOKEN_BUDGET", "4000"))
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "20000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+# detached UserRead copies, never the session-bound row. Per process, so a change made
+# on another node shows up here after USER_CACHE_TTL_SECONDS at the latest
+userPrincipalCache = TtlLruCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+
+async def getUserPrincipal(session, userId):
+    principal = userPrincipalCache.get(userId)
+    if principal is not None:
+        return principal
+
+    user = await asyncCrud.getUser(session, userId)
+    if not user:
+        return None
+
+    principal = models.UserRead.model_validate(user)
+    userPrincipalCache.set(userId, principal)
+    return principal
+
+def invalidateUserPrincipal(userId):
+    userPrincipalCache.invalidate(userId)
+
+def encodeItemCursor(sortBy, nextKey):
+    sortValue, itemId = nextKey
+    if isinstance(sortValue, datetime):
+        sortValue = sortValue.isoformat()
+    cursor = json.dumps({"sortBy": sortBy, "value": sortValue, "id": itemId}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+
+def decodeItemCursor(cursor, sortBy):
+    '''
+    Returns the (sortValue, id) key to continue after. Raises ValueError for a cursor
+    that is malformed or was issued for another sort order.
+    '''
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if decoded["sortBy"] != sortBy:
+            raise ValueError("cursor was issued for a different sortBy")
+        sortValue = datetime.fromisoformat(decoded["value"]) if sortBy == "purchaseDate" else int(decoded["value"])
+        return sortValue, int(decoded["id"])
+    except (KeyError, TypeError, binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"invalid cursor: {str(e)}")
+
+async def authenticateUser(session, userCredentials: models.UserLogin):
+    '''
+    session is an AsyncSession, bcrypt runs in the password pool, the event loop waits on both.
+    A hash made with an outdated BCRYPT_ROUNDS is replaced while the plain password is at hand.
+    '''
+    user = await asyncCrud.getUserByEmail(session, userCredentials.email)
+
+    if not user or not await security.verifyPasswordAsync(userCredentials.password, user.hashedPassword):
+        logger.warning("User authentication failed", extra={"email": userCredentials.email})
+        return None
+
+    logger.info("User authentication successful", extra={"user_id": user.id})
+
+    if security.needsRehash(user.hashedPassword):
+        hashedPassword = await security.getHashedPasswordAsync(userCredentials.password)
+        await asyncCrud.updatePasswordHash(session, user, hashedPassword)
+        invalidateUserPrincipal(user.id)
+        logger.info("Password rehashed with current cost factor", extra={"user_id": user.id, "rounds": security.BCRYPT_ROUNDS})
+
+    return user
+
+def registerNewUser(session, userData: models.UserCreate, hashedPassword: str):
     from worker.tasks import getMealsFromLlm
+    from worker.triggerWheel import scheduleTriggers
     logger.info("Registering new user", extra={"email": userData.email})
     existingUser = crud.getUserByEmail(session, userData.email)
     if existingUser:
         logger.warning("Registration failed: Email already exists", extra={"email": userData.email})
         raise HTTPException(400, "Email already exists")
-    newUser = crud.createUser(session, userData)
+    newUser = crud.createUser(session, userData, hashedPassword)
     logger.info("User created in DB", extra={"user_id": newUser.id})
 
     preferences = crud.createUserPreferences(session, newUser.id)
@@ -52,6 +137,7 @@ def registerNewUser(session, userData: models.UserCreate):
     logger.info("Initial scheduling complete", extra={"user_id": newUser.id, "next_run": nextRun.isoformat()})
 
     session.commit()
+    scheduleTriggers({newUser.id: nextRun})
     getMealsFromLlm.delay(newUser.id, currentMealWindowKey)
     return newUser
 
@@ -62,10 +148,14 @@ def separatePrioritizedItems(combinedPantryItems):
 
     highPriority = []
     normalPriority = []
+    # kept out of the LLM input, only used to rank items when the prompt has to be trimmed
+    daysLeft = {}
+    userSelectedIds = set()
 
     for localItem in allItems:
         shelfLife = localItem.item.avgShelfLife
         daysOwned = (datetime.utcnow() - localItem.purchaseDate).days
+        daysLeft[localItem.id] = shelfLife - daysOwned
 
         llmInputItem = models.LLMItemInput(
             pantryItemId=localItem.id,
@@ -82,8 +172,10 @@ def separatePrioritizedItems(combinedPantryItems):
             normalPriority.append(llmInputItem.model_dump())
     
     for userItem in userPrioritizedItems:
-        shelfLife = localItem.item.avgShelfLife
+        shelfLife = userItem.item.avgShelfLife
         daysOwned = (datetime.utcnow() - userItem.purchaseDate).days
+        daysLeft[userItem.id] = shelfLife - daysOwned
+        userSelectedIds.add(userItem.id)
 
         llmInputItem = models.LLMItemInput(
             pantryItemId=userItem.id,
@@ -102,7 +194,82 @@ def separatePrioritizedItems(combinedPantryItems):
     
     return {
         "allItems": normalPriority,
-        "highPriority": highPriority
+        "highPriority": highPriority,
+        "daysLeft": daysLeft,
+        "userSelectedIds": userSelectedIds
+    }
+
+def estimateItemTokens(llmInputItem):
+    # measured on the row buildPrompt actually emits for the item
+    return prompts.estimateTokens(prompts.encodeRow(llmInputItem, prompts.ITEM_COLUMNS)) + 1
+
+def selectItemsForPrompt(preparedData, tokenBudget):
+    '''
+    Trims the prepared lists so the ingredient part of the prompt fits tokenBudget.
+    Items are ranked user-selected first, then expiring, then by days of shelf life left.
+    The first pass takes at most one item per ingredient name so a pantry full of
+    the same thing doesn't crowd everything else out, a second pass fills what's left of the budget.
+    '''
+    daysLeft = preparedData["daysLeft"]
+    userSelectedIds = preparedData["userSelectedIds"]
+
+    candidates = [(item, True) for item in preparedData["highPriority"]]
+    candidates += [(item, False) for item in preparedData["allItems"]]
+
+    def rank(candidate):
+        item, isHighPriority = candidate
+        tier = 0 if item["pantryItemId"] in userSelectedIds else (1 if isHighPriority else 2)
+        return (tier, daysLeft.get(item["pantryItemId"], 0))
+
+    candidates.sort(key=rank)
+
+    selectedIds = set()
+    seenNames = set()
+    usedTokens = 0
+
+    for diversityPass in (True, False):
+        for item, _ in candidates:
+            if item["pantryItemId"] in selectedIds:
+                continue
+
+            name = (item["ingredientName"] or "").strip().lower()
+            if diversityPass and name in seenNames:
+                continue
+
+            itemTokens = estimateItemTokens(item)
+            if usedTokens + itemTokens > tokenBudget:
+                continue
+
+            selectedIds.add(item["pantryItemId"])
+            seenNames.add(name)
+            usedTokens += itemTokens
+
+    # a user-selected item can sit in both lists, it is sent once under high priority
+    highPriority = []
+    highPriorityIds = set()
+    for item in preparedData["highPriority"]:
+        if item["pantryItemId"] in selectedIds and item["pantryItemId"] not in highPriorityIds:
+            highPriority.append(item)
+            highPriorityIds.add(item["pantryItemId"])
+    allItems = [item for item in preparedData["allItems"]
+                if item["pantryItemId"] in selectedIds and item["pantryItemId"] not in highPriorityIds]
+
+    totalCount = len({item["pantryItemId"] for item, _ in candidates})
+    droppedCount = totalCount - len(selectedIds)
+
+    if droppedCount > 0:
+        logger.info("Pantry trimmed to fit prompt token budget", extra={
+            "token_budget": tokenBudget,
+            "estimated_tokens": usedTokens,
+            "kept_count": len(selectedIds),
+            "dropped_count": droppedCount
+        })
+
+    return {
+        **preparedData,
+        "allItems": allItems,
+        "highPriority": highPriority,
+        "droppedCount": droppedCount
     }
 
 def getMealBasedOnTime():
@@ -119,6 +286,9 @@ def prepareDataForMealSuggestionPrompt(session, userId, userSuggestions):
     combinedPantryItems = crud.getItemsToUseForMeals(session, userId, userSuggestions)
     preparedData = separatePrioritizedItems(combinedPantryItems)
 
+    if PROMPT_ITEM_TOKEN_BUDGET > 0:
+        preparedData = selectItemsForPrompt(preparedData, PROMPT_ITEM_TOKEN_BUDGET)
+
     return preparedData
 
 def getAndParseModelResponse(prompt):
@@ -139,185 +309,217 @@ def getAndParseModelResponse(prompt):
         logger.error(f"LLM Generation/Parsing Failed: {str(e)}", extra={"prompt_preview": prompt[:100] + "..."})
         raise e
 
-def buildPrompt(prioritizedItems, meal):
-    outputFormat = json.dumps(models.RecipeSuggestions.model_json_schema(), indent=2)
-    prompt= f"""
-    <task>
-    You are a meal-planning assistant. Your goals are:
-    1. Reduce food waste by prioritizing expiring items.
-    2. Suggest meals that taste normal and are easy to cook.
-    3. Respect realistic ingredient pairings and quantities.
-    </task>
-
-    <rules>
-    - You will receive two ingredient lists:
-        • high_priority_ingredients (close to expiry OR user-selected)
-        • normal_priority_ingredients (everything else)
-    - Some ingredients may appear in BOTH lists — treat them as high priority.
-    - You must suggest EXACTLY 3 meal ideas.
-    - A “meal” may be:
-        • A normal cooked recipe using raw ingredients
-        • A ready-to-eat item (e.g., frozen pizza)
-        • A main dish + a simple side
-    - Do NOT force ingredients together if they don’t fit. Taste > using everything.
-    - Pantry staples like oil, salt, pepper, garlic powder can be assumed available.
-    - You should maximize:
-        1. Use of high-priority items  
-        2. Meal quality  
-        3. Efficient pantry usage across the day
-    - When referencing pantry ingredients (anything from the input lists), you MUST include the exact pantryItemId.
-    - When referencing pantry staples (oil, salt, pepper, common spices), you MUST list them as ingredients, but they DO NOT have a pantryItemId.
-    - Units of measurement in the recipe MUST use common kitchen-friendly units.
-        • Examples: cups, tablespoons, teaspoons, pieces, slices, grams, ounces.
-        • Avoid units that humans cannot easily measure while cooking (e.g., “0.13 gallons”, “0.02 liters”, “0.3 pounds”).
-        • When the pantry item quantity is stored in a larger unit (e.g., "1 gallon of milk"), you are allowed to convert to smaller, more usable cooking units (e.g., “½ cup milk”).
-    - Put '-1' as the pantryItemId for staples.
-    </rules>
-
-    <input_format>
-    Each ingredient object looks like:
-    {{
-    "pantryItemId": 24,
-    "ingredientName": "Chicken Breast",
-    "ingredientBrand": "Kroger",
-    "quantity": 2,
-    "unit": lbs,
-    "purchaseDate": "2024-11-12T14:11:00.000Z"
-    }}
-    </input_format>
-
-    <output_requirements>
-    Your answer MUST be a single valid JSON object.
-    It MUST strictly follow this schema:
-
-    {outputFormat}
-
-    Do NOT explain anything.  
-    Do NOT add notes.  
-    Return ONLY the JSON object.
-    </output_requirements>
-
-    <high_priority_ingredients>
-    {json.dumps(prioritizedItems["highPriority"], indent=2)}
-    </high_priority_ingredients>
-
-    <normal_priority_ingredients>
-    {json.dumps(prioritizedItems["allItems"], indent=2)}
-    </normal_priority_ingredients>
-
-    <meal_time>
-    {meal}
-    </meal_time>
-    """
-
-    return prompt
-
-def getRecipeSuggestions(session, userId, userSuggestions=None, mealWindow=None):
-    logger.info("Generating recipe suggestions", extra={"user_id": userId, "meal_window": mealWindow})
-
+def prepareRecipeGeneration(session, userId, userSuggestions=None, mealWindow=None):
+    '''
+    Everything that happens before the LLM call: pantry lookup and cache lookup.
+    Returns the cache key plus either the cached recipes or the data the prompt is built from.
+    '''
     preparedData = prepareDataForMealSuggestionPrompt(session, userId, userSuggestions)
 
     if not mealWindow:
         mealWindow = getMealBasedOnTime()
 
-    prompt = buildPrompt(preparedData, mealWindow)
+    cacheKey = recipeCache.buildCacheKey(preparedData, mealWindow)
+    cachedRecipes = recipeCache.getCachedRecipes(cacheKey)
+    if cachedRecipes:
+        logger.info("Recipe cache hit, skipping LLM call", extra={"user_id": userId, "meal_window": mealWindow})
+
+    return {
+        "cacheKey": cacheKey,
+        "recipes": cachedRecipes,
+        "preparedData": preparedData,
+        "mealWindow": mealWindow
+    }
+
+def getRecipeSuggestions(session, userId, userSuggestions=None, mealWindow=None):
+    logger.info("Generating recipe suggestions", extra={"user_id": userId, "meal_window": mealWindow})
+
+    generation = prepareRecipeGeneration(session, userId, userSuggestions, mealWindow)
+    if generation["recipes"]:
+        return generation["recipes"]
+
+    prompt = prompts.buildPrompt(generation["preparedData"], generation["mealWindow"])
 
     recipes = getAndParseModelResponse(prompt)
+    recipeCache.storeRecipes(generation["cacheKey"], recipes)
 
     logger.info("Recipes generated successfully", extra={"count": len(recipes.recipes)})
 
     return recipes
 
+def recipesUseOnlyOwnItems(recipes: models.RecipeSuggestions, preparedData):
+    '''
+    In a batched prompt the model sees other users' pantryItemIds.
+    A user's recipes are only accepted if every id they reference came from that user's own lists.
+    '''
+    ownIds = {item["pantryItemId"] for item in preparedData["highPriority"]}
+    ownIds.update(item["pantryItemId"] for item in preparedData["allItems"])
+
+    for recipe in recipes.recipes:
+        for ingredient in recipe.ingredients:
+            if ingredient.pantryItemId not in (None, -1) and ingredient.pantryItemId not in ownIds:
+                return False
+    return True
+
+def parseBatchResponse(responseText, batchGenerations):
+    '''
+    Splits a batched response back into per-user RecipeSuggestions.
+    Users missing from the answer, or whose recipes reference someone else's items, are left out.
+    '''
+    batchSuggestions = models.BatchRecipeSuggestions.model_validate_json(responseText)
+
+    recipesByUser = {}
+    for userSuggestions in batchSuggestions.users:
+        generation = batchGenerations.get(userSuggestions.userId)
+        if not generation:
+            continue
+
+        recipes = models.RecipeSuggestions(recipes=userSuggestions.recipes)
+        if recipesUseOnlyOwnItems(recipes, generation["preparedData"]):
+            recipesByUser[userSuggestions.userId] = recipes
+        else:
+            logger.warning("Batched recipes referenced foreign pantry items", extra={"user_id": userSuggestions.userId})
+
+    return recipesByUser
+
+def generateRecipesConcurrently(pending, usersPerPrompt):
+    '''
+    pending is a list of (userId, generation).
+    Users are packed usersPerPrompt at a time into one prompt, all prompts go out together.
+    Returns ({userId: RecipeSuggestions}, {userId: exception}) for the users that got no recipes.
+    '''
+    groups = [pending[start:start + usersPerPrompt] for start in range(0, len(pending), usersPerPrompt)]
+
+    groupPrompts = []
+    for group in groups:
+        if len(group) == 1:
+            _, generation = group[0]
+            groupPrompts.append(prompts.buildPrompt(generation["preparedData"], generation["mealWindow"]))
+        else:
+            groupPrompts.append(prompts.buildBatchPrompt({
+                userId: (generation["preparedData"], generation["mealWindow"]) for userId, generation in group
+            }))
+
+    logger.info("Sending concurrent prompts to Gemini", extra={"prompt_count": len(groupPrompts), "user_count": len(pending)})
+    responses = ASYNC_LLM_CLIENT.generateMany(groupPrompts)
+
+    recipesByUser = {}
+    failures = {}
+    for group, response in zip(groups, responses):
+        try:
+            if isinstance(response, Exception):
+                raise response
+
+            if len(group) == 1:
+                userId, _ = group[0]
+                recipesByUser[userId] = models.RecipeSuggestions.model_validate_json(response)
+            else:
+                recipesByUser.update(parseBatchResponse(response, dict(group)))
+        except Exception as e:
+            logger.error(f"LLM Generation/Parsing Failed: {str(e)}", extra={"user_ids": [userId for userId, _ in group]})
+            for userId, _ in group:
+                failures[userId] = e
+            continue
+
+        for userId, _ in group:
+            if userId not in recipesByUser:
+                failures[userId] = ValueError("No recipes returned for user in batched response")
+
+    return recipesByUser, failures
+
+def getRecipeSuggestionsForUsers(session, userMealWindows):
+    '''
+    Worker path for many users at once.
+    Pantry and cache lookups happen one by one (cheap DB work), then the LLM calls go out together
+    through the shared async client, which caps how many are in flight.
+    With LLM_USERS_PER_PROMPT > 1 several users share one prompt, and users a batched answer
+    did not cover are retried with their own prompt when LLM_BATCH_FALLBACK_TO_SINGLE is on.
+    Returns {userId: RecipeSuggestions or the exception raised for that user}.
+    '''
+    results = {}
+    pending = []
+
+    for userId, mealWindow in userMealWindows:
+        try:
+            generation = prepareRecipeGeneration(session, userId, mealWindow=mealWindow)
+        except Exception as e:
+            logger.error(f"Preparing recipe prompt failed: {str(e)}", extra={"user_id": userId})
+            results[userId] = e
+            continue
+
+        if generation["recipes"]:
+            results[userId] = generation["recipes"]
+        else:
+            pending.append((userId, generation))
+
+    generationByUser = dict(pending)
+
+    # nothing written yet, end the read transaction so the connection goes back to the pool during the LLM wait
+    session.commit()
+
+    recipesByUser, failures = generateRecipesConcurrently(pending, LLM_USERS_PER_PROMPT)
+
+    if failures and LLM_USERS_PER_PROMPT > 1 and LLM_BATCH_FALLBACK_TO_SINGLE:
+        logger.info("Retrying users missing from batched responses with single prompts", extra={"user_count": len(failures)})
+        retried, failures = generateRecipesConcurrently([(userId, generationByUser[userId]) for userId in failures], 1)
+        recipesByUser.update(retried)
+
+    for userId, recipes in recipesByUser.items():
+        recipeCache.storeRecipes(generationByUser[userId]["cacheKey"], recipes)
+        results[userId] = recipes
+
+    results.update(failures)
+    return results
+
 def getQuantityToDeduct(session, userId, ingredients: List[models.Ingredient]):
     logger.info("Calculating inventory deductions", extra={"user_id": userId})
     ingredientMap = {}
     for ingredient in ingredients:
         if ingredient.pantryItemId != -1:
-            ingredientMap[ingredient.pantryItemId] = (ingredient.quantity, ingredient.unit)
+            ingredientMap[ingredient.pantryItemId] = (ingredient.quantity, ingredient.unit, ingredient.ingredientName)
 
     ingredientQtyInDb = crud.getIngredientQtyFromDb(session, userId, list(ingredientMap.keys()))
 
-    ingredientInput = []
+    resolvedDeductions = []
+    unresolvedInput = []
 
     for ingredient in ingredientQtyInDb:
+        quantityUsed, unitQtyUsed, ingredientName = ingredientMap[ingredient.id]
+
+        # most pairs are plain culinary conversions, only send what the local engine can't resolve to the LLM
+        convertedUsedQty = unitConverter.convertQuantity(quantityUsed, unitQtyUsed, ingredient.unit, ingredientName)
+        if convertedUsedQty is not None:
+            remainingQty = max(round(ingredient.quantity - convertedUsedQty, 2), 0)
+            resolvedDeductions.append(models.IngredientDeduction(
+                pantryItemId=ingredient.id,
+                quantityRemaining=remainingQty,
+                unit=ingredient.unit
+            ))
+            continue
+
         newIngredientUsage = models.IngredientUsage(
             pantryItemId=ingredient.id,
-            quantityUsed=ingredientMap[ingredient.id][0],
-            unitQtyUsed=ingredientMap[ingredient.id][1],
+            quantityUsed=quantityUsed,
+            unitQtyUsed=unitQtyUsed,
             qtyInDb=ingredient.quantity,
             unitInDb=ingredient.unit
         )
-        ingredientInput.append(newIngredientUsage.model_dump())
-
-    outputFormat = json.dumps(models.OutputIngredientDeduction.model_json_schema(), indent=2)
-
-    prompt = f"""
-    You are an ingredient-deduction assistant for a pantry inventory system.
-
-    Your job is to take recipe usage measurements (human-friendly units) and convert them into the standardized units used by the database. Then calculate the *new remaining quantity and the unit* for each pantry item.
-
-    <rules>
-    - Convert only using real culinary unit conversions.
-    - NEVER change the intended amount (e.g., “½ cup milk” must convert correctly to mL).
-    - ALWAYS convert into the database unit EXACTLY as provided in the input (unitInDb).
-    - NEVER hallucinate units or pantry items.
-    - If a pantryItemId is missing or the unit is not convertible, return an error object using the output schema.
-    - If a pantry item is a staple with no pantryItemId, IGNORE it entirely — return no output for that item.
-    - If conversion requires density assumptions, use:
-        • Water-like liquids: 1 cup = 240 mL  
-        • Milk: 1 cup = 240 mL  
-        • Oil: 1 cup = 240 mL  
-        • Flour: 1 cup = 120 g  
-        • Sugar: 1 cup = 200 g  
-        • Rice (uncooked): 1 cup = 185 g  
-        • Butter: 1 tablespoon = 14 g  
-    - If the input unit is vague (“pinch”, “dash”, “handful”), use common culinary assumptions:
-        • pinch = 0.36 g  
-        • dash = 0.6 g  
-        • handful = 30 g  
-    - Always round numerical values to at most **2 decimals**.
-    - NEVER output negative remaining quantities — if usage exceeds available, set remainingQty = 0.
-    - The final output must be a SINGLE JSON array following the provided schema.
-
-    </rules>
-
-    <inputs>
-    You will receive a JSON array of IngredientUsage objects.
-
-    Each IngredientUsage object has the following fields:
-
-    {{
-    "pantryItemId": number,
-    "quantityUsed": number,
-    "unitQtyUsed": string,
-    "qtyInDb": number,
-    "unitInDb": string
-    }}
-
-    Meaning:
-    - quantityUsed + unitQtyUsed → user-friendly measurement from recipe.
-    - qtyInDb + unitInDb → standardized DB storage for that item.
-
-    Below is the input JSON array:
-    {json.dumps(ingredientInput, indent=2)}
-
-    </inputs>
-
-    <task>
-    For each ingredient:
-    1. Convert (quantityUsed, unitQtyUsed) into the unitInDb using correct cooking conversions.
-    2. Compute:
-        remainingQty = qtyInDb - convertedUsedQty
-    3. Ensure remainingQty ≥ 0.
-    4. Produce an output object that matches EXACTLY the schema provided to you:
-    {outputFormat}
-
-    Return ONLY a single JSON array following the given output schema.
-    Do NOT include explanations.
-    Do NOT add text outside JSON.
-    </task>
-
-    """
+        unresolvedInput.append(newIngredientUsage.model_dump())
+
+    logger.info("Local unit conversion complete", extra={
+        "user_id": userId,
+        "resolved_locally": len(resolvedDeductions),
+        "sent_to_llm": len(unresolvedInput)
+    })
+
+    if unresolvedInput:
+        llmDeductions = getQuantityToDeductFromLlm(unresolvedInput)
+        resolvedDeductions.extend(llmDeductions.ingredientsUsed)
+
+    return models.OutputIngredientDeduction(ingredientsUsed=resolvedDeductions)
+
+def getQuantityToDeductFromLlm(ingredientInput):
+    prompt = prompts.buildDeductionPrompt(ingredientInput)
 
     logger.info("Sending deduction prompt to Gemini...")
     try:
@@ -410,6 +612,38 @@ def computeNextMealGenerationTime(userPreferences: models.UserPreferences, curre
     })
     return nextRunDatetimeObject, nextMealWindowKey
 
+def computeTriggerUpdates(triggerRows):
+    '''
+    Current window end and next run for a whole batch of (UserMealTrigger, UserPreferences) rows, no DB access.
+    Most users share the default meal times and one of ~30 offsets, so every distinct
+    (meal times, offset, window) combination is computed once and reused for everyone who has it.
+    '''
+    computed = {}
+    triggerUpdates = []
+
+    for trigger, preferences in triggerRows:
+        windowKey = trigger.nextMealWindowToCompute
+        combination = (preferences.breakfast, preferences.lunch, preferences.eveningSnack,
+                       preferences.dinner, preferences.loadBalancerOffset, windowKey)
+
+        if combination not in computed:
+            currentWindowEndTime = computeCurrentWindowEndTime(preferences, windowKey)
+            nextRun, nextMealWindowKey = computeNextMealGenerationTime(preferences, windowKey)
+            computed[combination] = (currentWindowEndTime, nextRun, nextMealWindowKey)
+
+        currentWindowEndTime, nextRun, nextMealWindowKey = computed[combination]
+        triggerUpdates.append({
+            "id": trigger.id,
+            "userId": trigger.userId,
+            "generatedWindowKey": windowKey,
+            "currentMealWindowEndTime": currentWindowEndTime,
+            "nextRun": nextRun,
+            "nextMealWindowToCompute": nextMealWindowKey
+        })
+
+    logger.info("Computed trigger updates", extra={"trigger_count": len(triggerRows), "distinct_schedules": len(computed)})
+    return triggerUpdates
+
 def computeCurrentWindowEndTime(userPreferences: models.UserPreferences, nextMealWindowKey: int):
     # TODO need to have a default for dinner
     # Currently dinner's end time will only be calculated when it's time for breakfast generation for next day
@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TtlLruCache:
+    '''
+    Small in-process cache: at most maxEntries entries, each dropped at its own expiry (epoch seconds).
+    Least recently used entries are evicted first once the bound is hit.
+    Thread safe, sync dependencies and endpoints run on FastAPI's threadpool.
+    '''
+    def __init__(self, maxEntries: int, ttlSeconds: float) -> None:
+        self.maxEntries = maxEntries
+        self.ttlSeconds = ttlSeconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expiresAt: float = None):
+        '''
+        Kept until expiresAt when it comes before the cache TTL.
+        '''
+        expiry = time.time() + self.ttlSeconds
+        if expiresAt is not None:
+            expiry = min(expiry, expiresAt)
+
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
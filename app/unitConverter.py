@@ -0,0 +1,180 @@
+import re
+from typing import Optional
+
+'''
+Local culinary unit conversion used when deducting recipe usage from the pantry.
+Every unit belongs to a dimension and has a factor to that dimension's base unit:
+    volume -> mL
+    mass   -> g
+    count  -> piece
+Conversions inside a dimension are a ratio of factors.
+Conversions between volume and mass need a density (g per mL) for the ingredient.
+Anything we cannot resolve returns None so the caller can fall back to the LLM.
+'''
+
+VOLUME = "volume"
+MASS = "mass"
+COUNT = "count"
+
+UNIT_DEFINITIONS = {
+    # volume, base mL
+    "ml": (VOLUME, 1.0),
+    "l": (VOLUME, 1000.0),
+    "tsp": (VOLUME, 4.92892),
+    "tbsp": (VOLUME, 14.7868),
+    "cup": (VOLUME, 240.0),
+    "floz": (VOLUME, 29.5735),
+    "pint": (VOLUME, 473.176),
+    "quart": (VOLUME, 946.353),
+    "gallon": (VOLUME, 3785.41),
+
+    # mass, base g
+    "mg": (MASS, 0.001),
+    "g": (MASS, 1.0),
+    "kg": (MASS, 1000.0),
+    "oz": (MASS, 28.3495),
+    "lb": (MASS, 453.592),
+    # vague units, same assumptions the deduction prompt gives the LLM
+    "pinch": (MASS, 0.36),
+    "dash": (MASS, 0.6),
+    "handful": (MASS, 30.0),
+
+    # count, base piece
+    "count": (COUNT, 1.0),
+    "dozen": (COUNT, 12.0),
+}
+
+UNIT_ALIASES = {
+    "milliliter": "ml", "millilitre": "ml", "mls": "ml",
+    "liter": "l", "litre": "l", "ltr": "l",
+    "teaspoon": "tsp", "tsps": "tsp", "t": "tsp",
+    "tablespoon": "tbsp", "tbsps": "tbsp", "tbs": "tbsp", "tbl": "tbsp", "T": "tbsp",
+    "c": "cup",
+    "fl oz": "floz", "fluid ounce": "floz", "fl. oz": "floz",
+    "pt": "pint",
+    "qt": "quart",
+    "gal": "gallon",
+    "milligram": "mg",
+    "gram": "g", "gr": "g", "gm": "g",
+    "kilogram": "kg", "kilo": "kg", "kgs": "kg",
+    "ounce": "oz",
+    "pound": "lb", "lbs": "lb",
+    "piece": "count", "pc": "count", "pcs": "count", "each": "count", "ea": "count",
+    "whole": "count", "item": "count", "unit": "count", "units": "count", "ct": "count",
+}
+
+# grams per mL, looked up by the exact ingredient name
+# flour/sugar/rice/butter come from the per-cup and per-tablespoon rules in the deduction prompt
+INGREDIENT_DENSITIES = {
+    "water": 1.0,
+    "milk": 1.03,
+    "oil": 0.92,
+    "flour": 120.0 / 240.0,
+    "sugar": 200.0 / 240.0,
+    "brown sugar": 220.0 / 240.0,
+    "powdered sugar": 120.0 / 240.0,
+    "rice": 185.0 / 240.0,
+    "butter": 14.0 / 14.7868,
+    "honey": 1.42,
+    "salt": 1.2,
+}
+
+# names that are the same ingredient for density purposes, anything else
+# ("rice vinegar", "peanut butter", "sugar snap peas") is left to the LLM
+INGREDIENT_DENSITY_VARIANTS = {
+    "tap water": "water",
+    "whole milk": "milk", "skim milk": "milk", "2% milk": "milk", "low fat milk": "milk", "low-fat milk": "milk",
+    "olive oil": "oil", "extra virgin olive oil": "oil", "vegetable oil": "oil", "canola oil": "oil",
+    "sunflower oil": "oil", "cooking oil": "oil",
+    "all-purpose flour": "flour", "all purpose flour": "flour", "plain flour": "flour", "white flour": "flour",
+    "granulated sugar": "sugar", "white sugar": "sugar", "caster sugar": "sugar",
+    "light brown sugar": "brown sugar", "dark brown sugar": "brown sugar",
+    "icing sugar": "powdered sugar", "confectioners sugar": "powdered sugar", "confectioners' sugar": "powdered sugar",
+    "white rice": "rice", "long grain rice": "rice", "long-grain rice": "rice", "basmati rice": "rice",
+    "jasmine rice": "rice",
+    "unsalted butter": "butter", "salted butter": "butter",
+    "table salt": "salt", "fine salt": "salt",
+}
+
+def normalizeUnit(unit: Optional[str]) -> str:
+    '''
+    Maps a free-form unit ("Cups", "tbsp.", "lbs") to its canonical key.
+    A missing unit is treated as a count, which is how pantry items like eggs are stored.
+    Unknown units are returned lowercased so identical unknown units still match each other.
+    '''
+    if unit is None or not unit.strip():
+        return "count"
+
+    raw = re.sub(r"\s+", " ", unit.strip()).rstrip(".")
+    # "T" vs "t" is the one place case matters
+    if raw in UNIT_ALIASES:
+        return UNIT_ALIASES[raw]
+
+    lowered = raw.lower()
+    candidates = [lowered]
+    if lowered.endswith("es"):
+        candidates.append(lowered[:-2])
+    if lowered.endswith("s"):
+        candidates.append(lowered[:-1])
+
+    for candidate in candidates:
+        if candidate in UNIT_DEFINITIONS:
+            return candidate
+        if candidate in UNIT_ALIASES:
+            return UNIT_ALIASES[candidate]
+
+    return _singularize(lowered)
+
+def _singularize(unit: str) -> str:
+    # only needs to be consistent, "slices" and "slice" (or "boxes" and "box") must end up the same
+    if re.search(r"(s|x|z|ch|sh)es$", unit):
+        return unit[:-2]
+    if unit.endswith("s") and not unit.endswith("ss") and len(unit) > 1:
+        return unit[:-1]
+    return unit
+
+def getDensity(ingredientName: Optional[str]) -> Optional[float]:
+    '''
+    Density for an exact (or known variant) ingredient name only, a name merely containing
+    a known ingredient ("rice vinegar", "peanut butter") is a different ingredient.
+    '''
+    if not ingredientName:
+        return None
+
+    name = re.sub(r"\s+", " ", ingredientName.strip().lower())
+    name = INGREDIENT_DENSITY_VARIANTS.get(name, name)
+    return INGREDIENT_DENSITIES.get(name)
+
+def convertQuantity(quantity: float, fromUnit: Optional[str], toUnit: Optional[str], ingredientName: Optional[str] = None) -> Optional[float]:
+    '''
+    Converts quantity from fromUnit to toUnit.
+    Returns None when the pair cannot be resolved locally (unknown unit,
+    count <-> volume/mass, or volume <-> mass for an ingredient with no known density).
+    '''
+    source = normalizeUnit(fromUnit)
+    target = normalizeUnit(toUnit)
+
+    if source == target:
+        return quantity
+
+    sourceDefinition = UNIT_DEFINITIONS.get(source)
+    targetDefinition = UNIT_DEFINITIONS.get(target)
+    if not sourceDefinition or not targetDefinition:
+        return None
+
+    sourceDimension, sourceFactor = sourceDefinition
+    targetDimension, targetFactor = targetDefinition
+    baseQuantity = quantity * sourceFactor
+
+    if sourceDimension == targetDimension:
+        return baseQuantity / targetFactor
+
+    if {sourceDimension, targetDimension} == {VOLUME, MASS}:
+        density = getDensity(ingredientName)
+        if density is None:
+            return None
+        if sourceDimension == VOLUME:
+            return (baseQuantity * density) / targetFactor
+        return (baseQuantity / density) / targetFactor
+
+    return None
@@ -1,58 +1,201 @@
+import asyncio
+import os
+import time
 from fastapi import WebSocket
-from typing import Dict
+from typing import Dict, Set
+import redis.asyncio as redis
+from app import eventRouting
 from app.logger import get_logger
 
 logger = get_logger("websocket_manager")
 
+# every socket gets a ping this often, anything the client sends back counts as a pong
+WS_HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "25"))
+# a socket silent for longer than interval + timeout is treated as dead and reaped
+WS_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("WS_HEARTBEAT_TIMEOUT_SECONDS", "20"))
+# a send that can't complete in this long means the client stopped reading, the socket is dropped
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+
 class ConnectionManager:
+    '''
+    Sockets held by this API node, several per user (phone + laptop).
+    Whenever a user gains their first or loses their last socket here, the node's id is
+    added to / removed from that user's entry in the Redis registry, which is what the worker
+    uses to route a meal event to the right node.
+    lastSeen holds when each socket last sent anything, the heartbeat loop reaps the silent ones
+    so half-open connections from dropped mobile clients don't pile up until a send fails.
+    '''
     def __init__(self) -> None:
-        self.activeConnections: Dict[int, WebSocket] = {}
+        self.activeConnections: Dict[int, Set[WebSocket]] = {}
+        self.lastSeen: Dict[WebSocket, float] = {}
+        self.redisClient = redis.from_url(eventRouting.REDIS_URL, decode_responses=True)
+
+        self.connectedTotal = 0
+        self.disconnectedTotal = 0
+        self.reapedTotal = 0
+        self.sendTimeouts = 0
+
+    def connectionCount(self):
+        return len(self.lastSeen)
+
+    def markSeen(self, websocket: WebSocket):
+        if websocket in self.lastSeen:
+            self.lastSeen[websocket] = time.monotonic()
+
+    def getMetrics(self):
+        return {
+            "liveConnections": self.connectionCount(),
+            "connectedUsers": len(self.activeConnections),
+            "connectedTotal": self.connectedTotal,
+            "disconnectedTotal": self.disconnectedTotal,
+            "reapedTotal": self.reapedTotal,
+            "sendTimeouts": self.sendTimeouts
+        }
+
+    async def _register(self, userId):
+        key = eventRouting.registryKey(userId)
+        try:
+            pipe = self.redisClient.pipeline(transaction=False)
+            pipe.zadd(key, {eventRouting.NODE_ID: time.time()})
+            pipe.expire(key, eventRouting.CONNECTION_REGISTRY_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to register connection in Redis: {e}", extra={"user_id": userId})
+
+    async def _unregister(self, userId):
+        try:
+            await self.redisClient.zrem(eventRouting.registryKey(userId), eventRouting.NODE_ID)
+        except Exception as e:
+            logger.warning(f"Failed to unregister connection in Redis: {e}", extra={"user_id": userId})
 
     async def connect(self, userId, websocket: WebSocket):
         await websocket.accept()
 
-        old_ws = self.activeConnections.get(userId)
-        if old_ws:
-            try:
-                await old_ws.close(code=1000)
-                logger.info("Closed previous connection for user", extra={"user_id": userId})
-            except Exception as e:
-                logger.warning(f"Error closing old connection: {e}", extra={"user_id": userId})
-        
-        self.activeConnections[userId] = websocket
+        sockets = self.activeConnections.setdefault(userId, set())
+        sockets.add(websocket)
+        self.lastSeen[websocket] = time.monotonic()
+        self.connectedTotal += 1
+        if len(sockets) == 1:
+            await self._register(userId)
 
         logger.info("User connected via WebSocket", extra={
             "user_id": userId, 
-            "total_active_connections": len(self.activeConnections)
+            "user_connections": len(sockets),
+            "total_active_connections": self.connectionCount()
         })
     
-    async def disconnect(self, userId):
-        ws = self.activeConnections.get(userId)
-        if ws:
-            try:
-                await ws.close(code=1000)
-            except Exception:
-                pass 
+    async def disconnect(self, userId, websocket: WebSocket, code: int = 1000):
+        sockets = self.activeConnections.get(userId)
+        if not sockets or websocket not in sockets:
+            return
+
+        sockets.discard(websocket)
+        self.lastSeen.pop(websocket, None)
+        self.disconnectedTotal += 1
+        try:
+            # a half-open socket may never take the close frame either
+            await asyncio.wait_for(websocket.close(code=code), timeout=WS_SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass 
 
-            if userId in self.activeConnections:
-                del self.activeConnections[userId]
+        if not sockets:
+            del self.activeConnections[userId]
+            await self._unregister(userId)
                 
-            logger.info("User disconnected", extra={
-                "user_id": userId, 
-                "total_active_connections": len(self.activeConnections)
-            })
+        logger.info("User disconnected", extra={
+            "user_id": userId, 
+            "total_active_connections": self.connectionCount()
+        })
         
-    async def sendToUser(self, userId):
-        ws = self.activeConnections.get(userId)
-        if ws:
+    async def sendToUser(self, userId, payload: str = eventRouting.MEAL_READY_PING):
+        '''
+        payload is already the final JSON text (see eventRouting.buildSocketPayload), sent without re-encoding.
+        '''
+        sockets = self.activeConnections.get(userId)
+        if not sockets:
+            logger.warning("Attempted to notify disconnected user", extra={"user_id": userId})
+            return
+
+        logger.info("Pushing 'meal_ready' event to client", extra={"user_id": userId, "connections": len(sockets), "payload_bytes": len(payload)})
+        await asyncio.gather(*(self._send(userId, ws, payload) for ws in list(sockets)))
+
+    async def _send(self, userId, websocket: WebSocket, payload: str):
+        try:
+            await asyncio.wait_for(websocket.send_text(payload), timeout=WS_SEND_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.sendTimeouts += 1
+            logger.warning("WS send timed out, dropping connection", extra={"user_id": userId})
+            await self.disconnect(userId, websocket, code=1001)
+        except Exception as e:
+            logger.error(f"Failed to send WS message: {e}", extra={"user_id": userId})
+            await self.disconnect(userId, websocket)
+
+    async def heartbeat(self):
+        '''
+        Pings every socket each WS_HEARTBEAT_INTERVAL_SECONDS and closes the ones
+        that have not sent anything within interval + timeout.
+        '''
+        deadline = WS_HEARTBEAT_INTERVAL_SECONDS + WS_HEARTBEAT_TIMEOUT_SECONDS
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL_SECONDS)
+            now = time.monotonic()
+
+            silent = []
+            alive = []
+            for userId, sockets in list(self.activeConnections.items()):
+                for ws in list(sockets):
+                    if now - self.lastSeen.get(ws, now) > deadline:
+                        silent.append((userId, ws))
+                    else:
+                        alive.append((userId, ws))
+
+            # all at once, a stalled socket only holds up its own send (bounded by WS_SEND_TIMEOUT_SECONDS)
+            # 1001 "going away", the client reconnects with backoff
+            await asyncio.gather(
+                *(self.disconnect(userId, ws, code=1001) for userId, ws in silent),
+                *(self._send(userId, ws, eventRouting.HEARTBEAT_PING) for userId, ws in alive)
+            )
+            reaped = len(silent)
+            self.reapedTotal += reaped
+
+            if reaped:
+                logger.info("Reaped silent WebSocket connections", extra={
+                    "reaped": reaped,
+                    "total_active_connections": self.connectionCount()
+                })
+
+    async def refreshRegistry(self):
+        '''
+        Keeps this node's registry entries (their scores and the keys' TTL) fresh while their sockets are open.
+        '''
+        while True:
+            await asyncio.sleep(eventRouting.CONNECTION_REGISTRY_TTL_SECONDS / 3)
+            userIds = list(self.activeConnections.keys())
+            if not userIds:
+                continue
             try:
-                logger.info("Pushing 'meal_ready' event to client", extra={"user_id": userId})
-                await ws.send_json({"event": "meal_ready"})
+                refreshedAt = time.time()
+                pipe = self.redisClient.pipeline(transaction=False)
+                for userId in userIds:
+                    pipe.zadd(eventRouting.registryKey(userId), {eventRouting.NODE_ID: refreshedAt})
+                    pipe.expire(eventRouting.registryKey(userId), eventRouting.CONNECTION_REGISTRY_TTL_SECONDS)
+                await pipe.execute()
             except Exception as e:
-                logger.error(f"Failed to send WS message: {e}", extra={"user_id": userId})
-                await self.disconnect(userId)
-        else:
-            logger.warning("Attempted to notify disconnected user", extra={"user_id": userId})
+                logger.error(f"Failed to refresh connection registry: {e}", extra={"user_count": len(userIds)})
+
+    async def unregisterAll(self):
+        '''
+        On shutdown: this process's sockets are going away, so are its registry entries and its event stream.
+        '''
+        userIds = list(self.activeConnections.keys())
+        try:
+            pipe = self.redisClient.pipeline(transaction=False)
+            pipe.delete(eventRouting.nodeStream(eventRouting.NODE_ID))
+            for userId in userIds:
+                pipe.zrem(eventRouting.registryKey(userId), eventRouting.NODE_ID)
+            await pipe.execute()
+            logger.info("Removed node from connection registry", extra={"user_count": len(userIds)})
+        except Exception as e:
+            logger.warning(f"Failed to clear connection registry on shutdown: {e}")
         
 manager = ConnectionManager()
-    
\ No newline at end of file
@@ -0,0 +1,74 @@
+import json
+import random
+import time
+import warnings
+from fastapi.encoders import jsonable_encoder
+import app.models as models
+import app.mealResponseCache as mealResponseCache
+
+'''
+Compares the CPU time of building the GET /proactiveMeals/ body from stored meal rows.
+"legacy" is the old path: json.loads every row into ProactiveMealResponse, model_dump it,
+then FastAPI validating that against response_model and encoding it again.
+"stitched" splices the stored JSON text into the response as-is.
+Run with: python -m benchmarks.mealResponse
+'''
+
+MEAL_COUNTS = [1, 2, 4]
+ITERATIONS = 2000
+
+INGREDIENTS = ["Milk", "Eggs", "Chicken Breast", "Spinach", "Rice", "Cheddar Cheese", "Tomatoes",
+               "Onion", "Greek Yogurt", "Bread", "Ground Beef", "Broccoli", "Butter", "Flour", "Apples"]
+
+def buildSuggestionsJson(rng):
+    recipes = []
+    for _ in range(3):
+        recipes.append(models.Recipe(
+            description="A quick weeknight meal that uses up what is about to expire.",
+            ingredients=[
+                models.Ingredient(
+                    pantryItemId=rng.randint(1, 500),
+                    ingredientName=rng.choice(INGREDIENTS),
+                    quantity=round(rng.uniform(0.25, 4), 2),
+                    unit=rng.choice(["cups", "g", "count", "tablespoons"])
+                ) for _ in range(rng.randint(4, 8))
+            ],
+            steps=[f"Step {step}: prepare and combine the ingredients as described." for step in range(1, rng.randint(4, 8))],
+            timeRequired="25 minutes"
+        ))
+    return models.RecipeSuggestions(recipes=recipes).model_dump_json()
+
+def buildMealRows(mealCount, seed=7):
+    rng = random.Random(seed)
+    return [(window, buildSuggestionsJson(rng)) for window in mealResponseCache.MEAL_RESPONSE_WINDOWS[:mealCount]]
+
+def legacyBody(mealRows):
+    # the old path assigned plain dicts to the model fields, pydantic warns about it on model_dump
+    warnings.simplefilter("ignore")
+    response = models.ProactiveMealResponse()
+    for mealWindow, suggestionsJson in mealRows:
+        setattr(response, mealWindow, json.loads(suggestionsJson))
+    dumped = response.model_dump(exclude_none=False)
+
+    validated = models.ProactiveMealResponse.model_validate(dumped)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def timePerCall(build, mealRows):
+    startTime = time.process_time()
+    for _ in range(ITERATIONS):
+        build(mealRows)
+    return (time.process_time() - startTime) / ITERATIONS * 1_000_000
+
+def main():
+    print(f"{'meals':>6} {'body bytes':>11} {'legacy us':>10} {'stitched us':>12} {'speedup':>8}")
+    for mealCount in MEAL_COUNTS:
+        mealRows = buildMealRows(mealCount)
+        assert json.loads(legacyBody(mealRows)) == json.loads(mealResponseCache.stitchResponseBody(mealRows))
+
+        legacyMicros = timePerCall(legacyBody, mealRows)
+        stitchedMicros = timePerCall(mealResponseCache.stitchResponseBody, mealRows)
+        bodyBytes = len(mealResponseCache.stitchResponseBody(mealRows))
+        print(f"{mealCount:>6} {bodyBytes:>11} {legacyMicros:>10.1f} {stitchedMicros:>12.1f} {legacyMicros / stitchedMicros:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import json
+import random
+import textwrap
+import app.models as models
+import app.prompts as prompts
+
+'''
+Compares the approximate token count of the recipe prompt before and after the compact encoding.
+"legacy" rebuilds the old layout: indented instruction text, pretty-printed schema
+and every ingredient as an indented JSON object.
+Run with: python -m benchmarks.promptEncoding
+'''
+
+PANTRY_SIZES = [10, 50, 200, 500]
+
+INGREDIENTS = ["Milk", "Eggs", "Chicken Breast", "Spinach", "Rice", "Cheddar Cheese", "Tomatoes",
+               "Onion", "Greek Yogurt", "Bread", "Ground Beef", "Broccoli", "Butter", "Flour", "Apples"]
+BRANDS = ["Kroger", "Great Value", "Organic Valley", None]
+UNITS = ["g", "ml", "count", "lbs", "oz"]
+
+def buildPantry(size, seed=7):
+    rng = random.Random(seed)
+    items = []
+    for pantryItemId in range(1, size + 1):
+        items.append(models.LLMItemInput(
+            pantryItemId=pantryItemId,
+            ingredientName=rng.choice(INGREDIENTS),
+            ingredientBrand=rng.choice(BRANDS),
+            quantity=round(rng.uniform(0.5, 1000), 1),
+            unit=rng.choice(UNITS),
+            daysOwned=rng.randint(0, 14)
+        ).model_dump())
+
+    highCount = max(1, size // 10)
+    return {"highPriority": items[:highCount], "allItems": items[highCount:]}
+
+def buildLegacyPrompt(prioritizedItems, meal):
+    outputFormat = json.dumps(models.RecipeSuggestions.model_json_schema(), indent=2)
+    return textwrap.indent(f"""
+{prompts.RECIPE_PROMPT_INSTRUCTIONS}
+<output_requirements>
+Your answer MUST be a single valid JSON object.
+It MUST strictly follow this schema:
+
+{outputFormat}
+
+Do NOT explain anything.
+Do NOT add notes.
+Return ONLY the JSON object.
+</output_requirements>
+
+<high_priority_ingredients>
+{json.dumps(prioritizedItems["highPriority"], indent=2)}
+</high_priority_ingredients>
+
+<normal_priority_ingredients>
+{json.dumps(prioritizedItems["allItems"], indent=2)}
+</normal_priority_ingredients>
+
+<meal_time>
+{meal}
+</meal_time>
+""", "    ")
+
+def main():
+    print(f"{'items':>6} {'legacy tokens':>14} {'compact tokens':>15} {'saved':>7}")
+    for size in PANTRY_SIZES:
+        pantry = buildPantry(size)
+        legacyTokens = prompts.estimateTokens(buildLegacyPrompt(pantry, "dinner"))
+        compactTokens = prompts.estimateTokens(prompts.buildPrompt(pantry, "dinner"))
+        saved = 1 - compactTokens / legacyTokens
+        print(f"{size:>6} {legacyTokens:>14} {compactTokens:>15} {saved:>7.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,11 @@ interface PantryItem{
     item: Item
 };
 
+interface PantryItemPage{
+    items: PantryItem[],
+    nextCursor: string | null
+};
+
 interface Pantry{
     pantryId: number,
     pantryNickname: string,
@@ -41,11 +46,57 @@ export default function PantryAccordion ({
 {
 
     const [items, setItems] = useState<PantryItem[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [isExpanded, setIsExpanded] = useState(false);
 
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
 
+    const fetchItemsPage = async (cursor: string | null) =>
+    {
+    /*
+        Loads one page of items, cursor is null for the first page.
+        Later pages are appended to what is already shown.
+    */
+        try
+        {
+            setLoading(true);
+            setError(null);
+
+            const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
+            const params = new URLSearchParams({ limit: "50" });
+            if(cursor){
+                params.set("cursor", cursor);
+            }
+
+            const response = await fetch(
+                `https://${API_BASE_URL}/pantry/${pantry.pantryId}/items?${params}`,
+                {
+                  headers:
+                  {
+                    'Authorization': `Bearer ${localStorage.getItem("jwt")}`,
+                  }
+                }
+            );
+
+            if(!response.ok){
+                throw new Error("failed to get items for this pantry");
+            }
+
+            const page: PantryItemPage = await response.json();
+            setItems(previous => cursor ? [...previous, ...page.items] : page.items);
+            setNextCursor(page.nextCursor);
+        }
+        catch (err: any)
+        {
+            setError(err.message);
+        }
+        finally
+        {
+            setLoading(false);
+        }
+    };
+
     const handlePantryExpand = async () => 
     {
     /*
@@ -56,37 +107,7 @@ export default function PantryAccordion ({
 
         if(!isExpanded)
         {
-            try
-            {
-                setLoading(true);
-                setError(null);
-
-                const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
-                const response = await fetch(
-                    `https://${API_BASE_URL}/${pantry.pantryId}/items`,
-                    {
-                      headers:
-                      {
-                        'Authorization': `Bearer ${localStorage.getItem("jwt")}`,
-                      }
-                    }
-                );
-
-                if(!response.ok){
-                    throw new Error("failed to get items for this pantry");
-                }
-
-                const pantryItems: PantryItem[] = await response.json();
-                setItems(pantryItems);
-            }
-            catch (err: any)
-            {
-                setError(err.message);
-            }
-            finally
-            {
-                setLoading(false);
-            }
+            await fetchItemsPage(null);
         }
     };
 
@@ -131,13 +152,13 @@ export default function PantryAccordion ({
                * We check if we *are not* loading AND
                * if the 'items' list is empty.
                */}
-              {!loading && items.length === 0 && (
+              {!loading && items.length === 0 && !error && (
                 <p className="text-black">This pantry is empty.</p>
               )}
     
               {/* * If we are *not* loading AND we *have* items
                */}
-              {!loading && items.length > 0 && (
+              {items.length > 0 && (
                 <ul className="space-y-2">
                   {/* We "map" over this component's 'items' state */}
                   {items.map((pantryItem) => (
@@ -196,6 +217,15 @@ export default function PantryAccordion ({
                   ))}
                 </ul>
               )}
+
+              {nextCursor && !loading && (
+                <button
+                  onClick={() => fetchItemsPage(nextCursor)}
+                  className="mt-3 text-sm text-blue-700 hover:underline"
+                >
+                  Load more
+                </button>
+              )}
             </div>
           )}
         </li>
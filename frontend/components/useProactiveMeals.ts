@@ -12,6 +12,10 @@ export default function useProactiveMeals(user: User | null)
     const [error, setError] = useState<string | null>(null);
 
     const wsRef = useRef<WebSocket | null>(null);
+    // reconnect state: the server closes sockets it considers dead (heartbeat reaping, send timeouts)
+    const reconnectAttemptRef = useRef(0);
+    const reconnectTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+    const shouldReconnectRef = useRef(false);
 
     // -------- FETCH MEALS (reusable helper) ----------
     const fetchLatestMeals = async () => {
@@ -54,25 +58,83 @@ export default function useProactiveMeals(user: User | null)
         ws.onopen = () => {
             console.log("🔌 WS connected");
             setConnectionStatus("connected");
+
+            // events sent while we were disconnected are gone, catch up with a fetch
+            if (reconnectAttemptRef.current > 0) {
+                fetchLatestMeals();
+            }
+            reconnectAttemptRef.current = 0;
         };
 
-        ws.onclose = () => setConnectionStatus("disconnected");
+        ws.onclose = () => {
+            setConnectionStatus("disconnected");
+            if (wsRef.current === ws) {
+                wsRef.current = null;
+            }
+            scheduleReconnect();
+        };
         ws.onerror = () => setConnectionStatus("disconnected");
 
-        ws.onmessage = () => {
-            // no meal window needed anymore
-            console.log("📩 WS: new meal generated → refetching...");
+        ws.onmessage = (message: MessageEvent) => {
+            const data = JSON.parse(message.data);
+
+            // server heartbeat, answering keeps the connection from being reaped
+            if (data.event === "ping") {
+                ws.send(JSON.stringify({ event: "pong" }));
+                return;
+            }
+
+            // small payloads arrive with the message, large ones (and cleanups) only send the ping
+            if (data.mealWindow && data.suggestions) {
+                console.log("📩 WS: new meal generated → applying pushed suggestions");
+                setProactiveMeals(prev => ({
+                    ...(prev ?? { breakfast: null, lunch: null, eveningSnack: null, dinner: null }),
+                    [data.mealWindow]: data.suggestions,
+                }));
+                return;
+            }
+
+            console.log("📩 WS: meals changed → refetching...");
             fetchLatestMeals();
         };
     }
 
+    // -------- RECONNECT WITH BACKOFF ----------
+    function scheduleReconnect() {
+        if (!shouldReconnectRef.current || reconnectTimerRef.current) {
+            return;
+        }
+
+        // 1s, 2s, 4s ... capped at 30s, jittered so clients dropped together don't return together
+        const baseDelay = Math.min(1000 * 2 ** reconnectAttemptRef.current, 30000);
+        const delay = baseDelay / 2 + Math.random() * baseDelay / 2;
+        reconnectAttemptRef.current += 1;
+
+        setConnectionStatus("connecting");
+        reconnectTimerRef.current = setTimeout(() => {
+            reconnectTimerRef.current = null;
+            if (shouldReconnectRef.current) {
+                initWebSocket();
+            }
+        }, delay);
+    }
+
+    function stopWebSocket(reason: string) {
+        shouldReconnectRef.current = false;
+        if (reconnectTimerRef.current) {
+            clearTimeout(reconnectTimerRef.current);
+            reconnectTimerRef.current = null;
+        }
+        if (wsRef.current) {
+            wsRef.current.close(1000, reason);
+            wsRef.current = null;
+        }
+    }
+
     // -------- EFFECT: On first mount + when user logs in ----------
     useEffect(() => {
         if (!user) {
-            if (wsRef.current) {
-                wsRef.current.close(1000, "User logged out");
-                wsRef.current = null;
-            }
+            stopWebSocket("User logged out");
             setConnectionStatus("disconnected");
             setProactiveMeals(null);
             return;
@@ -82,13 +144,11 @@ export default function useProactiveMeals(user: User | null)
         fetchLatestMeals();
 
         // 2) Open WS connection
+        shouldReconnectRef.current = true;
+        reconnectAttemptRef.current = 0;
         initWebSocket();
 
-        return () => {
-            if (wsRef.current) {
-                wsRef.current.close(1000, "Component unmount");
-            }
-        };
+        return () => stopWebSocket("Component unmount");
     }, [user]);
 
     return {
@@ -0,0 +1,66 @@
+import pytest
+from app.unitConverter import convertQuantity, getDensity, normalizeUnit
+
+@pytest.mark.parametrize("unit,expected", [
+    ("Cups", "cup"),
+    ("tbsp.", "tbsp"),
+    ("T", "tbsp"),
+    ("t", "tsp"),
+    ("lbs", "lb"),
+    ("fl oz", "floz"),
+    ("pinches", "pinch"),
+    ("pcs", "count"),
+    (None, "count"),
+    ("  ", "count"),
+])
+def test_normalizeUnit_known(unit, expected):
+    assert normalizeUnit(unit) == expected
+
+@pytest.mark.parametrize("plural,singular", [
+    ("slices", "slice"),
+    ("Cloves", "clove"),
+    ("cans", "can"),
+    ("boxes", "box"),
+    ("bunches", "bunch"),
+])
+def test_normalizeUnit_singularizes_unknown_units(plural, singular):
+    assert normalizeUnit(plural) == normalizeUnit(singular) == singular
+
+def test_convertQuantity_same_unknown_unit_in_any_number():
+    assert convertQuantity(3, "slices", "slice") == 3
+
+def test_convertQuantity_within_dimension():
+    assert convertQuantity(2, "cups", "ml") == pytest.approx(480)
+    assert convertQuantity(1, "kg", "lb") == pytest.approx(2.20462, rel=1e-4)
+    assert convertQuantity(2, "dozen", "count") == 24
+
+@pytest.mark.parametrize("ingredient,grams", [
+    ("flour", 120.0),
+    ("All-Purpose Flour", 120.0),
+    ("sugar", 200.0),
+    ("brown sugar", 220.0),
+    ("rice", 185.0),
+    ("whole milk", 247.2),
+])
+def test_convertQuantity_volume_to_mass(ingredient, grams):
+    assert convertQuantity(1, "cup", "g", ingredient) == pytest.approx(grams)
+
+def test_convertQuantity_mass_to_volume():
+    assert convertQuantity(14, "g", "tbsp", "butter") == pytest.approx(1.0)
+
+@pytest.mark.parametrize("ingredient", [
+    "rice vinegar",
+    "sugar snap peas",
+    "peanut butter",
+    "water chestnuts",
+    "milk chocolate chips",
+    "coconut oil spray",
+    None,
+])
+def test_convertQuantity_leaves_unknown_densities_to_the_llm(ingredient):
+    assert getDensity(ingredient) is None
+    assert convertQuantity(1, "cup", "g", ingredient) is None
+
+def test_convertQuantity_count_does_not_cross_dimensions():
+    assert convertQuantity(2, "count", "g", "flour") is None
+    assert convertQuantity(1, "slice", "g", "bread") is None
@@ -1,6 +1,24 @@
+import os
+
+# "wheel": worker/dispatcher.py queues users at their exact nextRun from a Redis sorted set
+# "poll": the old 60 second DB scan
+MEAL_TRIGGER_MODE = os.getenv("MEAL_TRIGGER_MODE", "wheel")
+TRIGGER_WHEEL_REBUILD_SECONDS = float(os.getenv("TRIGGER_WHEEL_REBUILD_SECONDS", "3600"))
+
 beat_schedule = {
-    "scan-users-for-meal-triggers": {
-        "task": "worker.tasks.scanMealTriggersAndQueueUsers",
+    "clean-old-meals": {
+        "task": "worker.tasks.cleanOldMealsTask",
         "schedule": 60.0,
     },
-}
\ No newline at end of file
+}
+
+if MEAL_TRIGGER_MODE == "poll":
+    beat_schedule["scan-users-for-meal-triggers"] = {
+        "task": "worker.tasks.scanMealTriggersAndQueueUsers",
+        "schedule": 60.0,
+    }
+else:
+    beat_schedule["rebuild-trigger-wheel"] = {
+        "task": "worker.tasks.rebuildTriggerWheel",
+        "schedule": TRIGGER_WHEEL_REBUILD_SECONDS,
+    }
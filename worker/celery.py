@@ -10,6 +10,11 @@ logger = get_logger("celery_loader")
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# LLM generation gets its own queue (and its own workers) so a backlog of meal generation
+# can never delay the scheduler tick, cleanup or wheel rebuild sitting on the default queue
+SCHEDULER_QUEUE = os.getenv("SCHEDULER_QUEUE", "scheduler")
+LLM_QUEUE = os.getenv("LLM_QUEUE", "llm")
+
 logger.info(f"Initializing Celery with broker: {REDIS_URL.split('@')[-1]}")
 
 celery = Celery(
@@ -20,4 +25,12 @@ celery = Celery(
 
 celery.conf.timezone = "UTC"
 celery.conf.enable_utc = True
-celery.conf.beat_schedule = beat_schedule
\ No newline at end of file
+celery.conf.beat_schedule = beat_schedule
+
+celery.conf.task_default_queue = SCHEDULER_QUEUE
+celery.conf.task_routes = {
+    "worker.tasks.getMealsFromLlm": {"queue": LLM_QUEUE},
+    "worker.tasks.getMealsFromLlmBatch": {"queue": LLM_QUEUE},
+}
+# an LLM task holds its slot for seconds, don't let one worker hoard messages other workers could start on
+celery.conf.worker_prefetch_multiplier = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
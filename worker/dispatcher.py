@@ -0,0 +1,80 @@
+import os
+import time
+from datetime import datetime, timedelta
+from app import crud
+from app.database import getSession
+from app.logger import get_logger
+from worker import triggerWheel, schedulerShards
+from worker.tasks import queueMealGenerationForTriggers
+
+logger = get_logger("trigger_dispatcher")
+
+'''
+Long running process that replaces the 60 second trigger scan.
+It sleeps until the earliest nextRun on the trigger wheel (or until a new trigger is scheduled),
+claims everything due, and queues those users through the same path the scan uses.
+Several dispatchers can run side by side: claiming from the wheel is atomic and the
+trigger rows are locked with SKIP LOCKED, so a user is only ever queued by one of them.
+Run with: python -m worker.dispatcher
+'''
+
+TRIGGER_DISPATCH_BATCH_SIZE = int(os.getenv("TRIGGER_DISPATCH_BATCH_SIZE", "1000"))
+# upper bound on a single sleep, so a lost wakeup can't stall the dispatcher for long
+TRIGGER_DISPATCH_MAX_IDLE_SECONDS = float(os.getenv("TRIGGER_DISPATCH_MAX_IDLE_SECONDS", "30"))
+# claimed users whose row another scheduler had locked go back on the wheel this much later
+TRIGGER_DISPATCH_LOCKED_RETRY_SECONDS = float(os.getenv("TRIGGER_DISPATCH_LOCKED_RETRY_SECONDS", "5"))
+
+def dispatchDueUsers(userIds, now):
+    with next(getSession()) as session:
+        triggerRows = crud.getTriggersWithPreferences(session, userIds=userIds)
+
+        dueTriggerRows = [(trigger, preferences) for trigger, preferences in triggerRows if trigger.nextRun <= now]
+        # wheel entries can be stale after a rebuild, those users go back on at the nextRun the table has
+        notDue = {trigger.userId: trigger.nextRun for trigger, _ in triggerRows if trigger.nextRun > now}
+
+        # rows skipped by SKIP LOCKED are being handled elsewhere, but if that transaction rolls back
+        # nothing would put them on the wheel again, so retry them shortly (users whose trigger is gone are dropped)
+        missingUserIds = set(userIds) - {trigger.userId for trigger, _ in triggerRows}
+        if missingUserIds:
+            retryAt = now + timedelta(seconds=TRIGGER_DISPATCH_LOCKED_RETRY_SECONDS)
+            for userId in crud.getTriggerUserIds(session, missingUserIds):
+                notDue[userId] = retryAt
+
+        triggerWheel.scheduleTriggers(notDue)
+
+        if not dueTriggerRows:
+            session.commit()
+            return 0
+
+        logger.info(f"Dispatching {len(dueTriggerRows)} users due for meal generation.")
+        return queueMealGenerationForTriggers(session, dueTriggerRows)
+
+def runDispatcher():
+    logger.info("Trigger dispatcher starting, rebuilding wheel from database")
+    with next(getSession()) as session:
+        triggerWheel.rebuildFromDb(session)
+
+    while True:
+        now = datetime.utcnow()
+        userIds = []
+        try:
+            userIds = triggerWheel.claimDueUsers(now, TRIGGER_DISPATCH_BATCH_SIZE)
+            if userIds:
+                startTime = time.monotonic()
+                queuedCount = dispatchDueUsers(userIds, now)
+                schedulerShards.recordTick("dispatcher", time.monotonic() - startTime, queuedCount)
+                continue
+
+            untilNextDue = triggerWheel.secondsUntilNextDue(now)
+            if untilNextDue is None:
+                untilNextDue = TRIGGER_DISPATCH_MAX_IDLE_SECONDS
+            triggerWheel.waitForWakeup(min(untilNextDue, TRIGGER_DISPATCH_MAX_IDLE_SECONDS))
+
+        except Exception as e:
+            logger.error(f"Trigger dispatch failed: {str(e)}", extra={"claimed_count": len(userIds)})
+            # put claimed users straight back so they are retried instead of waiting for the next rebuild
+            triggerWheel.scheduleTriggers({userId: now for userId in userIds})
+            time.sleep(1)
+
+if __name__ == "__main__":
+    runDispatcher()
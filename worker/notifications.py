@@ -0,0 +1,53 @@
+import time
+import redis
+from app import eventRouting
+from app.logger import get_logger
+
+logger = get_logger("notifications")
+
+redisClient = redis.Redis(host=eventRouting.REDIS_HOST, port=6379, db=0, decode_responses=True)
+
+def notifyUsers(userIds, payloadByUser=None):
+    '''
+    Tells the API nodes holding these users' sockets that their meals changed.
+    payloadByUser maps a userId to the socket text built with eventRouting.buildSocketPayload,
+    users without one get the bare meal_ready ping.
+    One pipeline prunes stale registry entries and looks up which nodes hold each user, a second
+    appends one stream entry per user to each of those nodes' streams. Users with no open socket
+    anywhere cost nothing more. A node that has not refreshed an entry within
+    CONNECTION_REGISTRY_TTL_SECONDS is treated as dead and gets nothing.
+    '''
+    if not userIds:
+        return
+    payloadByUser = payloadByUser or {}
+
+    staleBefore = time.time() - eventRouting.CONNECTION_REGISTRY_TTL_SECONDS
+    pipe = redisClient.pipeline(transaction=False)
+    for userId in userIds:
+        pipe.zremrangebyscore(eventRouting.registryKey(userId), "-inf", f"({staleBefore}")
+        pipe.zrange(eventRouting.registryKey(userId), 0, -1)
+    nodesPerUser = pipe.execute()[1::2]
+
+    eventsByNode = {}
+    for userId, nodeIds in zip(userIds, nodesPerUser):
+        event = {"userId": userId, "payload": payloadByUser.get(userId, eventRouting.MEAL_READY_PING)}
+        for nodeId in nodeIds:
+            eventsByNode.setdefault(nodeId, []).append(event)
+
+    if not eventsByNode:
+        logger.info("No connected users to notify", extra={"user_count": len(userIds)})
+        return
+
+    pipe = redisClient.pipeline(transaction=False)
+    for nodeId, nodeEvents in eventsByNode.items():
+        stream = eventRouting.nodeStream(nodeId)
+        for event in nodeEvents:
+            pipe.xadd(stream, event, maxlen=eventRouting.EVENT_STREAM_MAX_LEN, approximate=True)
+        pipe.expire(stream, eventRouting.EVENT_STREAM_TTL_SECONDS)
+    pipe.execute()
+
+    logger.info("Published meal notifications", extra={
+        "user_count": len(userIds),
+        "node_count": len(eventsByNode),
+        "with_payload": len(payloadByUser)
+    })
@@ -0,0 +1,95 @@
+import os
+import time
+import uuid
+import redis
+from app.logger import get_logger
+
+logger = get_logger("scheduler_shards")
+
+'''
+Splits the trigger scan into SCHEDULER_SHARD_COUNT shards (userId % SCHEDULER_SHARD_COUNT).
+A scan of a shard only runs while it holds that shard's Redis lease, so any number of workers
+can pick up shard scans and two overlapping ticks never work the same shard at once.
+Row locks taken with SKIP LOCKED cover the case where a lease expires under a slow tick.
+Each shard keeps its own tick timing in a Redis hash, read back by getShardMetrics.
+'''
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+
+SCHEDULER_SHARD_COUNT = int(os.getenv("SCHEDULER_SHARD_COUNT", "8"))
+# longer than a normal tick, short enough that a crashed worker doesn't hold a shard for long
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "120"))
+
+redisClient = redis.Redis(host=REDIS_HOST, port=6379, db=0)
+
+# only the holder of the lease may release it
+RELEASE_LEASE_SCRIPT = redisClient.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+def _leaseKey(shard):
+    return f"scheduler:shard:{shard}:lease"
+
+def _metricsKey(shard):
+    return f"scheduler:shard:{shard}:metrics"
+
+def acquireLease(shard):
+    token = uuid.uuid4().hex
+    if redisClient.set(_leaseKey(shard), token, nx=True, ex=SCHEDULER_LEASE_SECONDS):
+        return token
+    return None
+
+def releaseLease(shard, token):
+    try:
+        RELEASE_LEASE_SCRIPT(keys=[_leaseKey(shard)], args=[token])
+    except redis.RedisError as e:
+        # the lease runs out on its own
+        logger.warning(f"Failed to release scheduler lease: {str(e)}", extra={"shard": shard})
+
+def recordTick(shard, durationSeconds: float, queuedCount: int):
+    durationMs = round(durationSeconds * 1000, 1)
+    try:
+        pipe = redisClient.pipeline(transaction=False)
+        pipe.hset(_metricsKey(shard), mapping={
+            "lastTickAt": time.time(),
+            "lastDurationMs": durationMs,
+            "lastQueued": queuedCount
+        })
+        pipe.hincrby(_metricsKey(shard), "ticks", 1)
+        pipe.hincrbyfloat(_metricsKey(shard), "totalDurationMs", durationMs)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record scheduler tick: {str(e)}", extra={"shard": shard})
+
+    logger.info("Scheduler shard tick complete", extra={"shard": shard, "duration_ms": durationMs, "queued": queuedCount})
+
+def recordSkippedTick(shard):
+    try:
+        redisClient.hincrby(_metricsKey(shard), "skippedTicks", 1)
+    except redis.RedisError:
+        pass
+
+def getShardMetrics():
+    shards = list(range(SCHEDULER_SHARD_COUNT)) + ["dispatcher"]
+    try:
+        pipe = redisClient.pipeline(transaction=False)
+        for shard in shards:
+            pipe.hgetall(_metricsKey(shard))
+        rawMetrics = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Scheduler shard metrics unavailable: {str(e)}")
+        return {}
+
+    shardMetrics = {}
+    for shard, raw in zip(shards, rawMetrics):
+        if not raw:
+            continue
+        metrics = {key.decode(): float(value) for key, value in raw.items()}
+        ticks = metrics.get("ticks", 0)
+        metrics["avgDurationMs"] = round(metrics.get("totalDurationMs", 0) / ticks, 1) if ticks else 0.0
+        shardMetrics[str(shard)] = metrics
+
+    return shardMetrics
@@ -1,17 +1,18 @@
 from worker.celery import celery
+from celery import group
 from datetime import datetime
 from app.database import getSession
-from app import crud, services, models
+from app import crud, services, models, eventRouting, mealResponseCache
 from typing import List
-import redis
-import json
 import os
+import time
 from app.logger import get_logger
+from worker import triggerWheel, schedulerShards, notifications
 
 logger = get_logger("worker")
 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-redisClient = redis.Redis(host=REDIS_HOST, port=6379, db=0)
+# users handed to one getMealsFromLlmBatch task, their LLM calls run concurrently inside it
+LLM_ASYNC_BATCH_SIZE = int(os.getenv("LLM_ASYNC_BATCH_SIZE", "100"))
 
 MEAL_WINDOWS = {
     0: 'breakfast',
@@ -20,64 +21,132 @@ MEAL_WINDOWS = {
     3: 'dinner'
 }
 
+def cleanOldMealsAndNotify(session, now):
+    cleanedUsers = crud.cleanOldMeals(session, now)
+    session.commit()
+
+    mealResponseCache.invalidateUsers(cleanedUsers)
+    notifications.notifyUsers(cleanedUsers)
+
+    return cleanedUsers
+
+def dispatchMealGeneration(mealsToGenerate):
+    '''
+    Sends (userId, windowKey) pairs to the LLM queue as one celery group of
+    LLM_ASYNC_BATCH_SIZE chunks, published over a single producer connection
+    instead of one delay() round-trip per chunk.
+    '''
+    if not mealsToGenerate:
+        return
+
+    chunks = [mealsToGenerate[start:start + LLM_ASYNC_BATCH_SIZE]
+              for start in range(0, len(mealsToGenerate), LLM_ASYNC_BATCH_SIZE)]
+    group(getMealsFromLlmBatch.s(chunk) for chunk in chunks).apply_async()
+
+    logger.info("Dispatched meal generation chunks", extra={"user_count": len(mealsToGenerate), "chunk_count": len(chunks)})
+
+def queueMealGenerationForTriggers(session, triggerRows):
+    '''
+    Shared by the polling scan and the trigger wheel dispatcher.
+    triggerRows are (UserMealTrigger, UserPreferences) pairs from crud.getTriggersWithPreferences.
+    Computes every trigger's next run in one pass, writes them back in one statement, commits,
+    then queues the LLM work in chunks and puts the new nextRun values on the wheel.
+    '''
+    triggerUpdates = services.computeTriggerUpdates(triggerRows)
+    crud.bulkUpdateMealTriggers(session, triggerUpdates)
+    session.commit()
+
+    mealsToGenerate = [(update["userId"], update["generatedWindowKey"]) for update in triggerUpdates]
+    dispatchMealGeneration(mealsToGenerate)
+
+    triggerWheel.scheduleTriggers({update["userId"]: update["nextRun"] for update in triggerUpdates})
+
+    logger.info(f"Batch complete. Successfully scheduled {len(triggerUpdates)} users.")
+    return len(triggerUpdates)
+
+@celery.task
+def cleanOldMealsTask():
+    try:
+        with next(getSession()) as session:
+            cleanedUsers = cleanOldMealsAndNotify(session, datetime.utcnow())
+            return len(cleanedUsers)
+    except Exception as e:
+        logger.critical(f"Meal cleanup failed: {str(e)}")
+        raise e
+
 @celery.task
 def scanMealTriggersAndQueueUsers():
-    logger.info("Scheduler tick: Scanning for due meal triggers")
-    
+    '''
+    Polling fallback, only scheduled when MEAL_TRIGGER_MODE=poll.
+    In the default wheel mode worker/dispatcher.py queues users at their exact due time.
+    Fans out one scan per shard so the scan scales with the number of workers.
+    '''
+    logger.info("Scheduler tick: Fanning out shard scans", extra={"shard_count": schedulerShards.SCHEDULER_SHARD_COUNT})
+
+    for shard in range(schedulerShards.SCHEDULER_SHARD_COUNT):
+        scanMealTriggerShard.delay(shard)
+
+    return schedulerShards.SCHEDULER_SHARD_COUNT
+
+@celery.task
+def scanMealTriggerShard(shard):
+    leaseToken = schedulerShards.acquireLease(shard)
+    if not leaseToken:
+        logger.warning("Previous tick still holds shard lease, skipping", extra={"shard": shard})
+        schedulerShards.recordSkippedTick(shard)
+        return 0
+
+    startTime = time.monotonic()
     try:
         with next(getSession()) as session:
             now = datetime.utcnow()
-            cleanedUsers = crud.cleanOldMeals(session, now)
 
-            for uid in cleanedUsers:
-                    redisClient.publish("mealGenerated", json.dumps({"userId": uid}))
-                    logger.info("Notified user of meal cleanup", extra={"user_id": uid})
+            dueTriggerRows = crud.getTriggersWithPreferences(
+                session, now=now, shard=shard, shardCount=schedulerShards.SCHEDULER_SHARD_COUNT)
 
-            dueUsers: List[models.UserMealTrigger] = crud.getDueUsersByMealTriggers(session, now)
-            
-            if not dueUsers:
-                logger.info("No users due for meals at this time.")
+            queuedCount = 0
+            if dueTriggerRows:
+                logger.info(f"Found {len(dueTriggerRows)} users due for meal generation.", extra={"shard": shard})
+                queuedCount = queueMealGenerationForTriggers(session, dueTriggerRows)
+            else:
                 session.commit()
-                return 0
 
-            logger.info(f"Found {len(dueUsers)} users due for meal generation.")
-            
-            success_count = 0
-            for user in dueUsers:
-                try:
-                    userId = user.userId
-                    toBeGeneratedWindowKey = user.nextMealWindowToCompute
-
-                    logger.info("Processing trigger for user", extra={"user_id": userId, "window_key": toBeGeneratedWindowKey})
-
-                    userPreferences = crud.getUserPreferences(session, userId)
-
-                    currentWindowEndTime = services.computeCurrentWindowEndTime(userPreferences, toBeGeneratedWindowKey)
-                    crud.updateCurrentWindowEndTime(user, currentWindowEndTime)
-
-                    getMealsFromLlm.delay(userId, toBeGeneratedWindowKey)
-                    
-                    justGeneratedWindowKey = toBeGeneratedWindowKey
-                    nextRun, nextToBeGeneratedWindowKey = services.computeNextMealGenerationTime(userPreferences, justGeneratedWindowKey)
-
-                    crud.updateNextRunForUser(user, nextRun, nextToBeGeneratedWindowKey)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Failed to process trigger for User {user.userId}: {str(e)}")
-                    continue
-            
-            session.commit()
-            logger.info(f"Batch complete. Successfully scheduled {success_count}/{len(dueUsers)} users.")
-            return success_count
-            
+        schedulerShards.recordTick(shard, time.monotonic() - startTime, queuedCount)
+        return queuedCount
+
     except Exception as e:
-        logger.critical(f"Scheduler failed: {str(e)}")
+        logger.critical(f"Scheduler failed: {str(e)}", extra={"shard": shard})
         raise e
+    finally:
+        schedulerShards.releaseLease(shard, leaseToken)
+
+@celery.task
+def rebuildTriggerWheel():
+    with next(getSession()) as session:
+        return triggerWheel.rebuildFromDb(session)
     
+def storeMeal(session, userId, mealWindow, recipes: models.RecipeSuggestions):
+    suggestionsJson = recipes.model_dump_json()
+
+    storedProactiveMealSuggestion = crud.storeProactiveMealSuggestions(
+        session=session,
+        userId=userId,
+        mealWindow=mealWindow,
+        suggestionsJson=suggestionsJson
+    )
+
+    crud.markNewMealAsCurrentMeal(session, userId, storedProactiveMealSuggestion.id)
+
+    logger.info("Meal generation successful & stored", extra={"user_id": userId, "window": mealWindow})
+
+    return suggestionsJson
+
 @celery.task(bind=True, max_retries=3)
 def getMealsFromLlm(self, userId, mealWindowKey):
+    '''
+    Single-user generation (also the fallback for users a batch failed).
+    Goes through the shared async client like the batch does, so it counts against LLM_MAX_IN_FLIGHT.
+    '''
     logger.info("Starting LLM Meal Generation Task", extra={"user_id": userId, "window_key": mealWindowKey})
 
     try:
@@ -85,23 +154,12 @@ def getMealsFromLlm(self, userId, mealWindowKey):
 
             mealWindow = MEAL_WINDOWS.get(mealWindowKey, "dinner")
 
-            recipes: models.RecipeSuggestions = services.getRecipeSuggestions(session, userId, mealWindow=mealWindow)
-
-            suggestionsJson = recipes.model_dump_json()
-
-            storedProactiveMealSuggestion = crud.storeProactiveMealSuggestions(
-                session=session,
-                userId=userId,
-                mealWindow=mealWindow,
-                suggestionsJson=suggestionsJson
-            )
+            recipes = services.getRecipeSuggestionsForUsers(session, [(userId, mealWindow)])[userId]
+            if isinstance(recipes, Exception):
+                raise recipes
 
-            crud.markNewMealAsCurrentMeal(session, userId, storedProactiveMealSuggestion.id)
-
-            message = json.dumps({"userId": userId})
-            redisClient.publish("mealGenerated", message)
-
-            logger.info("Meal generation successful & published to Redis", extra={"user_id": userId, "channel": "mealGenerated"})
+            suggestionsJson = storeMeal(session, userId, mealWindow, recipes)
+            notifications.notifyUsers([userId], {userId: eventRouting.buildSocketPayload(mealWindow, suggestionsJson)})
 
             return {"status": "success", "userId": userId, "mealWindow": mealWindow}
             
@@ -109,3 +167,40 @@ def getMealsFromLlm(self, userId, mealWindowKey):
         logger.error(f"Meal generation task failed: {str(e)}", extra={"user_id": userId})
         raise e
 
+
+@celery.task
+def getMealsFromLlmBatch(userMealWindowKeys):
+    '''
+    Generates meals for many users in one worker slot.
+    The LLM calls run concurrently on the process-wide async client, so a slot waits
+    roughly one LLM latency for the whole batch instead of one per user.
+    Users whose generation failed are retried individually through getMealsFromLlm.
+    '''
+    logger.info("Starting batched LLM Meal Generation Task", extra={"user_count": len(userMealWindowKeys)})
+
+    windowKeyByUser = {userId: mealWindowKey for userId, mealWindowKey in userMealWindowKeys}
+    mealWindowByUser = {userId: MEAL_WINDOWS.get(mealWindowKey, "dinner") for userId, mealWindowKey in windowKeyByUser.items()}
+
+    with next(getSession()) as session:
+        results = services.getRecipeSuggestionsForUsers(session, list(mealWindowByUser.items()))
+
+        payloadByUser = {}
+        failedUsers = []
+        for userId, result in results.items():
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                suggestionsJson = storeMeal(session, userId, mealWindowByUser[userId], result)
+                payloadByUser[userId] = eventRouting.buildSocketPayload(mealWindowByUser[userId], suggestionsJson)
+            except Exception as e:
+                logger.error(f"Batched meal generation failed, falling back to single task: {str(e)}", extra={"user_id": userId})
+                session.rollback()
+                failedUsers.append(userId)
+
+    notifications.notifyUsers(list(payloadByUser.keys()), payloadByUser)
+
+    if failedUsers:
+        group(getMealsFromLlm.s(userId, windowKeyByUser[userId]) for userId in failedUsers).apply_async()
+
+    logger.info(f"Batched generation complete. {len(payloadByUser)}/{len(userMealWindowKeys)} users stored.")
+    return len(payloadByUser)
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timezone
+import redis
+from app import crud
+from app.logger import get_logger
+
+logger = get_logger("trigger_wheel")
+
+'''
+Redis sorted-set timer wheel for UserMealTrigger.nextRun.
+member = userId, score = nextRun as a UTC epoch timestamp.
+The UserMealTrigger table stays the durable source of truth, the wheel is only an index of
+who is due next so the dispatcher can sleep until the exact due time instead of polling the DB.
+Anything written here can be rebuilt from the table with rebuildFromDb.
+'''
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+
+WHEEL_KEY = "mealTriggers:wheel"
+WAKEUP_KEY = "mealTriggers:wakeup"
+
+redisClient = redis.Redis(host=REDIS_HOST, port=6379, db=0)
+
+# pops up to ARGV[2] members with score <= ARGV[1] atomically, so two dispatchers never claim the same user
+CLAIM_DUE_SCRIPT = redisClient.register_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+""")
+
+def toScore(naiveUtc: datetime) -> float:
+    # the codebase stores naive UTC datetimes
+    return naiveUtc.replace(tzinfo=timezone.utc).timestamp()
+
+def scheduleTriggers(nextRunByUser):
+    '''
+    nextRunByUser is {userId: nextRun}. Call after the matching DB commit.
+    Pushes a wakeup so a sleeping dispatcher re-reads the earliest due time.
+    '''
+    if not nextRunByUser:
+        return
+
+    try:
+        pipe = redisClient.pipeline(transaction=False)
+        pipe.zadd(WHEEL_KEY, {userId: toScore(nextRun) for userId, nextRun in nextRunByUser.items()})
+        pipe.lpush(WAKEUP_KEY, 1)
+        pipe.ltrim(WAKEUP_KEY, 0, 0)
+        pipe.execute()
+    except redis.RedisError as e:
+        # the periodic rebuild will pick these up from the table
+        logger.error(f"Failed to schedule triggers on the wheel: {str(e)}", extra={"count": len(nextRunByUser)})
+
+def claimDueUsers(now: datetime, limit: int):
+    due = CLAIM_DUE_SCRIPT(keys=[WHEEL_KEY], args=[toScore(now), limit])
+    return [int(userId) for userId in due]
+
+def secondsUntilNextDue(now: datetime):
+    earliest = redisClient.zrange(WHEEL_KEY, 0, 0, withscores=True)
+    if not earliest:
+        return None
+    return earliest[0][1] - toScore(now)
+
+def waitForWakeup(timeoutSeconds: float):
+    '''
+    Blocks until a new trigger is scheduled or the timeout passes, whichever comes first.
+    '''
+    redisClient.blpop([WAKEUP_KEY], timeout=max(timeoutSeconds, 0.01))
+
+def rebuildFromDb(session, chunkSize: int = 10000):
+    '''
+    Re-adds every UserMealTrigger to the wheel with the nextRun stored in the table.
+    Merged into the live key rather than swapped in, so triggers scheduled while this runs are not lost.
+    A score that is stale because the row changed after we read it only makes the dispatcher look
+    at that user early, where the row is re-checked and the user rescheduled at its real nextRun.
+    '''
+    count = 0
+    batch = {}
+    for userId, nextRun in crud.getAllMealTriggerSchedules(session):
+        batch[userId] = toScore(nextRun)
+        if len(batch) >= chunkSize:
+            redisClient.zadd(WHEEL_KEY, batch)
+            count += len(batch)
+            batch = {}
+    if batch:
+        redisClient.zadd(WHEEL_KEY, batch)
+        count += len(batch)
+
+    redisClient.lpush(WAKEUP_KEY, 1)
+    redisClient.ltrim(WAKEUP_KEY, 0, 0)
+
+    logger.info("Trigger wheel rebuilt from database", extra={"trigger_count": count})
+    return count